@@ -1 +1,7 @@
+import django
+
+
 __version__ = "3.1.0"
+
+if django.VERSION < (3, 2):
+    default_app_config = 'generic_plus.apps.GenericPlusConfig'
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class GenericPlusConfig(AppConfig):
+
+    name = 'generic_plus'
+    verbose_name = 'Generic Plus'
+
+    def ready(self):
+        from generic_plus.contenttypes import content_types, clear_content_types
+
+        content_types.register_models()
+        post_migrate.connect(
+            clear_content_types, dispatch_uid='generic_plus.clear_content_types')
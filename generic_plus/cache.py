@@ -0,0 +1,245 @@
+"""
+Read-through caching of the generic related objects of GenericForeignFileFields
+in Django's cache framework, for fields created with a ``cache_alias``.
+
+An entry is stored per (content type, object id, field identifier), holding
+the loaded field values of the related row (or a marker if there is no row).
+The descriptor, prefetch_generic_files(), prefetch_related(),
+GenericFileLoader and auto-prefetches read from the cache before querying,
+and store what they load from the database. Keys hold the primary database
+of the instance, so that reads from its replicas share the entries that
+writes to the primary invalidate.
+
+Entries are deleted when a related object is saved or deleted (for both
+the instance it points at and, if it was re-pointed, the one it pointed at
+when it was loaded), and when the related manager adds, removes, clears or
+creates related objects. They are deleted right away, so that the current
+transaction doesn't read them, and again when the transaction commits, in
+case another process stored the old row in the meantime.
+"""
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_init, post_save
+
+from generic_plus.compat import compat_rel_to
+from generic_plus.routers import get_primary
+
+
+__all__ = (
+    'get_cached_related_objects', 'fill_from_cache', 'cache_related_objects',
+    'store_related_objects', 'invalidate_cached_instances', 'invalidate_related_objects',
+    'aget_cached_related_objects', 'afill_from_cache', 'acache_related_objects')
+
+
+# Stored for instances without a related row, to tell them apart from
+# instances that aren't in the cache.
+NO_RELATED_OBJECT = ()
+
+# Related model => GenericForeignFileFields with a cache_alias
+_cached_fields = {}
+
+# Key of the instance __dict__ entry in which related objects keep the
+# generic keys (see get_generic_key()) they were loaded or last saved with
+LOADED_KEYS_ATTR = '_generic_plus_cache_keys'
+
+
+def get_cache_key(field, content_type_id, object_id, field_identifier, using):
+    opts = compat_rel_to(field)._meta
+    return 'generic_plus:%s.%s:%s:%s:%s:%s' % (
+        opts.app_label, opts.model_name, get_primary(using) or using,
+        content_type_id, object_id, field_identifier or '')
+
+
+def get_instance_cache_key(field, instance):
+    field_identifier = field.field_identifier if field.field_identifier_field_name else None
+    return get_cache_key(
+        field, field.get_content_type_id(instance), instance._get_pk_val(),
+        field_identifier, instance._state.db)
+
+
+def get_generic_key(field, rel_obj):
+    """
+    Return the (content type id, object id, field identifier) that
+    ``rel_obj`` points at for ``field``. Deferred values are None rather
+    than loaded.
+    """
+    values = rel_obj.__dict__
+    field_identifier = None
+    if field.field_identifier_field_name:
+        field_identifier = values.get(field.field_identifier_field_name)
+    return (
+        values.get('%s_id' % field.content_type_field_name),
+        values.get(field.object_id_field_name),
+        field_identifier)
+
+
+def get_related_object_cache_key(field, rel_obj, using):
+    return get_cache_key(field, *(get_generic_key(field, rel_obj) + (using,)))
+
+
+def dump_related_object(rel_obj):
+    if rel_obj is None:
+        return NO_RELATED_OBJECT
+    deferred = rel_obj.get_deferred_fields()
+    attnames = []
+    values = []
+    for f in rel_obj._meta.concrete_fields:
+        if f.attname in deferred:
+            continue
+        value = getattr(rel_obj, f.attname)
+        if isinstance(value, FieldFile):
+            value = value.name
+        attnames.append(f.attname)
+        values.append(value)
+    return (tuple(attnames), tuple(values))
+
+
+def load_related_object(field, value, using):
+    if value == NO_RELATED_OBJECT:
+        return None
+    attnames, values = value
+    return compat_rel_to(field).from_db(using, attnames, values)
+
+
+def _get_instance_keys(field, instances):
+    return dict((get_instance_cache_key(field, i), i) for i in instances)
+
+
+def _load_found(field, keys, found):
+    return dict(
+        (id(keys[key]), load_related_object(field, value, keys[key]._state.db))
+        for key, value in found.items())
+
+
+def get_cached_related_objects(field, instances):
+    """
+    Return a dict of ``id(instance)`` => related object (or None) for those
+    of ``instances`` that have ``field``'s related object in the cache.
+    """
+    if not field.cache_alias or not instances:
+        return {}
+    keys = _get_instance_keys(field, instances)
+    return _load_found(field, keys, caches[field.cache_alias].get_many(list(keys)))
+
+
+def fill_from_cache(field, instances):
+    """
+    Set the field cache of those of ``instances`` that have ``field``'s
+    related object in the cache, and return the others.
+    """
+    found = get_cached_related_objects(field, instances)
+    if not found:
+        return instances
+    for instance in instances:
+        if id(instance) in found:
+            field.set_loaded_value(instance, found[id(instance)])
+    return [i for i in instances if id(i) not in found]
+
+
+async def afill_from_cache(field, instances):
+    """Async counterpart of fill_from_cache()."""
+    found = await aget_cached_related_objects(field, instances)
+    if not found:
+        return instances
+    for instance in instances:
+        if id(instance) in found:
+            field.set_loaded_value(instance, found[id(instance)])
+    return [i for i in instances if id(i) not in found]
+
+
+def cache_related_objects(field, instances):
+    """Store the related objects in the field cache of ``instances``."""
+    store_related_objects(field, [(i, field.get_cached_value(i)) for i in instances])
+
+
+def store_related_objects(field, related_objects):
+    """
+    Store ``related_objects``, a list of (instance, related object or None)
+    pairs, in the cache.
+    """
+    if not field.cache_alias or not related_objects:
+        return
+    caches[field.cache_alias].set_many(dict(
+        (get_instance_cache_key(field, i), dump_related_object(rel_obj))
+        for i, rel_obj in related_objects), timeout=field.cache_timeout)
+
+
+async def aget_cached_related_objects(field, instances):
+    """Async counterpart of get_cached_related_objects()."""
+    if not field.cache_alias or not instances:
+        return {}
+    keys = _get_instance_keys(field, instances)
+    return _load_found(field, keys, await caches[field.cache_alias].aget_many(list(keys)))
+
+
+async def acache_related_objects(field, instances):
+    """Async counterpart of cache_related_objects()."""
+    if not field.cache_alias or not instances:
+        return
+    await caches[field.cache_alias].aset_many(dict(
+        (get_instance_cache_key(field, i), dump_related_object(field.get_cached_value(i)))
+        for i in instances), timeout=field.cache_timeout)
+
+
+def invalidate_cache_keys(field, keys, using):
+    cache = caches[field.cache_alias]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys), using=using)
+
+
+def invalidate_cached_instances(field, instances, using):
+    """Delete the cache entries of ``field`` for ``instances``."""
+    if field.cache_alias:
+        invalidate_cache_keys(
+            field, [get_instance_cache_key(field, i) for i in instances], using)
+
+
+def invalidate_related_objects(field, rel_objs, using):
+    """
+    Delete the cache entries of ``field`` for the instances that
+    ``rel_objs``, related objects, point at.
+    """
+    if field.cache_alias:
+        invalidate_cache_keys(
+            field, [get_related_object_cache_key(field, o, using) for o in rel_objs], using)
+
+
+def remember_generic_keys(sender, instance, **kwargs):
+    """
+    post_init receiver for related models, which keeps the generic keys an
+    instance was loaded with, so that re-pointing it also invalidates the
+    entry of the instance it pointed at.
+    """
+    instance.__dict__[LOADED_KEYS_ATTR] = dict(
+        (field, get_generic_key(field, instance)) for field in _cached_fields.get(sender, ()))
+
+
+def invalidate_related_object(sender, instance, using, **kwargs):
+    """post_save and post_delete receiver for related models."""
+    loaded_keys = instance.__dict__.get(LOADED_KEYS_ATTR) or {}
+    current_keys = {}
+    for field in _cached_fields.get(sender, ()):
+        generic_key = current_keys[field] = get_generic_key(field, instance)
+        keys = [get_cache_key(field, *(generic_key + (using,)))]
+        loaded_key = loaded_keys.get(field)
+        if loaded_key is not None and loaded_key[1] is not None and loaded_key != generic_key:
+            keys.append(get_cache_key(field, *(loaded_key + (using,))))
+        invalidate_cache_keys(field, keys, using)
+    if kwargs.get('signal') is post_save:
+        instance.__dict__[LOADED_KEYS_ATTR] = current_keys
+
+
+def register_cached_field(field, rel_model):
+    """
+    Connect invalidate_related_object() to the saves and deletes of
+    ``rel_model``, the related model of ``field``, a GenericForeignFileField
+    with a cache_alias, and remember_generic_keys() to its instantiation.
+    """
+    fields = _cached_fields.setdefault(rel_model, [])
+    if field not in fields:
+        fields.append(field)
+    dispatch_uid = 'generic_plus.cache.%s' % rel_model._meta.label_lower
+    post_save.connect(invalidate_related_object, sender=rel_model, dispatch_uid=dispatch_uid)
+    post_delete.connect(invalidate_related_object, sender=rel_model, dispatch_uid=dispatch_uid)
+    post_init.connect(remember_generic_keys, sender=rel_model, dispatch_uid=dispatch_uid)
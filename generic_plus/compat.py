@@ -10,3 +10,14 @@ def compat_rel(f):
 
 def compat_rel_to(f):
     return getattr(compat_rel(f), 'model' if dj19 else 'to')
+
+
+def can_return_bulk_insert_pks(connection):
+    """
+    Whether bulk_create() sets the primary keys of the rows it inserts on
+    ``connection`` (``can_return_ids_from_bulk_insert`` before Django 3.0).
+    """
+    features = connection.features
+    return bool(
+        getattr(features, 'can_return_rows_from_bulk_insert', False)
+        or getattr(features, 'can_return_ids_from_bulk_insert', False))
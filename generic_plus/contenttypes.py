@@ -0,0 +1,172 @@
+"""
+A process-wide table of the ContentTypes of installed models, shared by the
+descriptors, querysets and formsets of GenericForeignFileFields.
+
+ContentType.objects.get_for_model() keeps its cache on the manager, which is
+cleared whenever ContentType.objects.clear_cache() is called (e.g. in tests
+and after migrations), and then queries for one content type at a time. The
+table instead loads every content type of a database with a single query the
+first time that database is used, or when warm() is called, and is only
+reset when the content types themselves can have changed.
+"""
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+__all__ = ('ContentTypeTable', 'content_types')
+
+
+class ContentTypeTable(object):
+
+    def __init__(self):
+        # (model, for_concrete_model) => (app_label, model_name)
+        self._natural_keys = {}
+        # database alias => {(app_label, model_name): ContentType}
+        self._content_types = {}
+        # database alias => {content type id: (app_label, model_name)}
+        self._natural_keys_by_id = {}
+
+    def register_models(self, models=None):
+        """
+        Record the natural keys of ``models`` (all installed models by
+        default), for both values of ``for_concrete_model``.
+        """
+        if models is None:
+            models = apps.get_models(include_auto_created=True)
+        for model in models:
+            for for_concrete_model in (True, False):
+                self._natural_keys[model, for_concrete_model] = self._get_natural_key(
+                    model, for_concrete_model)
+
+    def _get_natural_key(self, model, for_concrete_model):
+        opts = model._meta.concrete_model._meta if for_concrete_model else model._meta
+        return (opts.app_label, opts.model_name)
+
+    def warm(self, using=None):
+        """
+        Load the content types of database ``using`` (all configured
+        databases by default).
+        """
+        aliases = [using] if using else list(connections)
+        for alias in aliases:
+            self._load(alias)
+
+    def _load(self, using):
+        from django.contrib.contenttypes.models import ContentType
+
+        content_types = {}
+        for content_type in ContentType.objects.db_manager(using).all():
+            content_types[content_type.app_label, content_type.model] = content_type
+        self._set_loaded(using, content_types)
+        return content_types
+
+    def _set_loaded(self, using, content_types):
+        self._content_types[using] = content_types
+        self._natural_keys_by_id[using] = dict(
+            (content_type.pk, natural_key)
+            for natural_key, content_type in content_types.items())
+
+    async def awarm(self, using=None):
+        """Async counterpart of warm()."""
+        aliases = [using] if using else list(connections)
+        for alias in aliases:
+            await self._aload(alias)
+
+    async def _aload(self, using):
+        from django.contrib.contenttypes.models import ContentType
+
+        content_types = {}
+        async for content_type in ContentType.objects.db_manager(using).all():
+            content_types[content_type.app_label, content_type.model] = content_type
+        self._set_loaded(using, content_types)
+        return content_types
+
+    def clear(self, using=None):
+        """
+        Forget the loaded content types of ``using`` (of all databases by
+        default), which are then loaded again when next needed.
+        """
+        if using:
+            self._content_types.pop(using, None)
+            self._natural_keys_by_id.pop(using, None)
+        else:
+            self._content_types.clear()
+            self._natural_keys_by_id.clear()
+
+    def _resolve(self, model, for_concrete_model, using):
+        if not isinstance(model, type):
+            model = model.__class__
+        try:
+            natural_key = self._natural_keys[model, for_concrete_model]
+        except KeyError:
+            natural_key = self._natural_keys[model, for_concrete_model] = \
+                self._get_natural_key(model, for_concrete_model)
+        return model, natural_key, using or DEFAULT_DB_ALIAS
+
+    def get_for_model(self, model, for_concrete_model=True, using=None):
+        """
+        Return the ContentType of ``model`` (a model class or instance) in
+        database ``using``, creating it if it doesn't exist yet.
+        """
+        model, natural_key, using = self._resolve(model, for_concrete_model, using)
+        content_types = self._content_types.get(using)
+        if content_types is None:
+            content_types = self._load(using)
+        try:
+            return content_types[natural_key]
+        except KeyError:
+            pass
+
+        from django.contrib.contenttypes.models import ContentType
+
+        content_type = ContentType.objects.db_manager(using).get_for_model(
+            model, for_concrete_model=for_concrete_model)
+        content_types[natural_key] = content_type
+        self._natural_keys_by_id[using][content_type.pk] = natural_key
+        return content_type
+
+    async def aget_for_model(self, model, for_concrete_model=True, using=None):
+        """Async counterpart of get_for_model()."""
+        model, natural_key, using = self._resolve(model, for_concrete_model, using)
+        content_types = self._content_types.get(using)
+        if content_types is None:
+            content_types = await self._aload(using)
+        try:
+            return content_types[natural_key]
+        except KeyError:
+            pass
+
+        from django.contrib.contenttypes.models import ContentType
+
+        content_type, _ = await ContentType.objects.db_manager(using).aget_or_create(
+            app_label=natural_key[0], model=natural_key[1])
+        content_types[natural_key] = content_type
+        self._natural_keys_by_id[using][content_type.pk] = natural_key
+        return content_type
+
+    def get_id(self, model, for_concrete_model=True, using=None):
+        return self.get_for_model(model, for_concrete_model, using).pk
+
+    def get_natural_key(self, content_type_id, using=None):
+        """
+        Return the (app_label, model_name) of the ContentType with id
+        ``content_type_id`` in database ``using``, or None if there isn't
+        one. The content types are loaded again once if the id is unknown.
+        """
+        using = using or DEFAULT_DB_ALIAS
+        natural_keys = self._natural_keys_by_id.get(using)
+        if natural_keys is None or content_type_id not in natural_keys:
+            self._load(using)
+            natural_keys = self._natural_keys_by_id[using]
+        return natural_keys.get(content_type_id)
+
+
+content_types = ContentTypeTable()
+
+
+def clear_content_types(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate receiver: content types may have been created or removed
+    (or, after a flush, recreated with new ids).
+    """
+    content_types.clear(using)
@@ -2,25 +2,47 @@
 Defines GenericForeignFileField, a subclass of GenericRelation from
 django.contrib.contenttypes.
 """
+from collections import namedtuple
 from functools import reduce
-import itertools
+import contextlib
+import functools
 import operator
+import time
+import weakref
 
 import django
-from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import ValidationError
 from django.core.files.base import File
 from django.core.files.uploadedfile import UploadedFile
-from django.db import connection, router, models
+from django.db import (
+    DEFAULT_DB_ALIAS, DatabaseError, connections, router, models, transaction)
 from django.db.models.fields.files import FieldFile, FileDescriptor
+from django.db.models.fields.related import lazy_related_operation
 
 from django.contrib.contenttypes.admin import GenericInlineModelAdmin
 from django.contrib.contenttypes.fields import GenericRelation, GenericRel
 
-from generic_plus.compat import compat_rel, compat_rel_to
+from generic_plus.cache import (
+    get_cached_related_objects, cache_related_objects, store_related_objects,
+    invalidate_cached_instances, invalidate_related_objects, register_cached_field,
+    dump_related_object, aget_cached_related_objects, acache_related_objects)
+from generic_plus.compat import can_return_bulk_insert_pks, compat_rel, compat_rel_to
+from generic_plus.contenttypes import content_types
+from generic_plus.identity import get_current_identity_map
+from generic_plus.loader import get_current_loader
+from generic_plus.prefetch import aprefetch_generic_files
+from generic_plus.routers import READ_HINT
+from generic_plus.sync import register_synced_field
+from generic_plus.utils import chunked
 from generic_plus.forms import (
     generic_fk_file_formfield_factory, generic_fk_file_widget_factory)
 
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
+
 try:
     from django.utils.functional import curry
 except ImportError:
@@ -51,7 +73,9 @@ class GenericForeignFileField(GenericRelation):
             An instance of FieldFile, with obj.field_name.related_object
             as the generic related instance (or None if there is no
             related object). A getattr on ``field_name`` will perform a
-            database query.
+            database query, unless the field was created with
+            ``lazy_related_object=True``, in which case the query is
+            deferred until ``related_object`` is accessed.
     getattr(instance, '%%s_raw' %% field_name):
             An instance of FieldFile that does not sync with the generic
             related object. Use this if you need to retrieve the file path
@@ -75,7 +99,10 @@ class GenericForeignFileField(GenericRelation):
     field_identifier_field_name = None
 
     def __init__(self, to, rel_file_field_name=None, field_identifier="",
-            missing_file_fallback=True, **kwargs):
+            missing_file_fallback=True, auto_prefetch=False,
+            lazy_related_object=False, related_only=None, prefetch_chunk_size=None,
+            cache_alias=None, cache_timeout=DEFAULT_TIMEOUT, url_cache_ttl=None,
+            sync_file_column=False, **kwargs):
         """
         Parameters
         ----------
@@ -91,10 +118,61 @@ class GenericForeignFileField(GenericRelation):
             will show the admin's file field widget in the event that there is
             a value on the model for the file field, but no corresponding row
             in the table with the generic foreign key.
+        auto_prefetch : bool
+            If set to True, the first access of the field on an instance that
+            was loaded as part of a queryset loads the related objects of all
+            of the instances from that queryset in a single query, as though
+            the field had been passed to ``prefetch_related()``. Instances
+            loaded with ``iterator()`` or ``aiterator()`` are not grouped.
+        lazy_related_object : bool
+            If set to True, getattr(instance, field_name) returns a FieldFile
+            built from the file path stored on the instance without querying
+            the generic related table. The query runs the first time the
+            FieldFile's ``related_object`` attribute is accessed.
+        related_only : iterable of str
+            Names of the fields of the generic related model to load when
+            the field reads related rows (in the descriptor, prefetches and
+            ``bulk_related_objects()``). The primary key, content type,
+            object id, field identifier and file fields are always loaded.
+            By default all fields are loaded.
+        prefetch_chunk_size : int
+            The maximum number of object ids to filter on in one query when
+            prefetching related rows. Larger sets of instances are loaded
+            with several queries (or, through GenericPlusQuerySet, a
+            subquery on the parent queryset). Defaults to half of the
+            database backend's ``max_query_params``, or no limit.
+        cache_alias : str
+            The alias of a cache in the ``CACHES`` setting in which to cache
+            the loaded fields of related rows (see generic_plus.cache), to
+            be read before querying the generic related table. The entries
+            are invalidated when related objects are saved or deleted.
+        cache_timeout : int
+            The timeout of the cache entries. Defaults to the cache's
+            default timeout.
+        url_cache_ttl : int or float
+            The number of seconds for which the FieldFile's ``url`` is
+            memoized (and forgotten sooner if the file name changes). Keep
+            it below the lifetime of URLs signed by the storage. None (the
+            default) disables memoization, except for the URLs generated by
+            prefetch_file_urls(), which are then kept until the file name
+            changes.
+        sync_file_column : bool
+            If set to True, the file column of the instance is updated
+            whenever its generic related object is saved or deleted (see
+            generic_plus.sync), so that the related model doesn't have to
+            copy the path over in its save() method.
         """
         self.rel_file_field_name = rel_file_field_name or self.rel_file_field_name
         self.field_identifier = field_identifier
         self.missing_file_fallback = missing_file_fallback
+        self.auto_prefetch = auto_prefetch
+        self.lazy_related_object = lazy_related_object
+        self.related_only = tuple(related_only) if related_only else None
+        self.prefetch_chunk_size = prefetch_chunk_size
+        self.cache_alias = cache_alias
+        self.cache_timeout = cache_timeout
+        self.url_cache_ttl = url_cache_ttl
+        self.sync_file_column = sync_file_column
 
         self.file_kwargs = {
             'editable': (django.VERSION > (1, 10)),
@@ -143,8 +221,12 @@ class GenericForeignFileField(GenericRelation):
     def get_cached_value(self, instance, **kwargs):
         cache_name = self.get_cache_name()
         if django.VERSION > (2, 0):
-            return super(GenericForeignFileField, self).get_cached_value(
+            value = super(GenericForeignFileField, self).get_cached_value(
                 instance, **kwargs)
+            if isinstance(value, CompactRelatedObject):
+                # The instance was unpickled (see generic_plus.models)
+                value = instance._state.fields_cache[cache_name] = value.load()
+            return value
         else:
             return instance.__dict__[cache_name]
 
@@ -154,6 +236,36 @@ class GenericForeignFileField(GenericRelation):
             super(GenericForeignFileField, self).set_cached_value(instance, value)
         else:
             instance.__dict__[cache_name] = value
+        self.clear_file_memo(instance)
+
+    def set_loaded_value(self, instance, value):
+        """
+        Store ``value``, a related object (or None) loaded from the database
+        or the cache, in the field cache of ``instance``. While a
+        GenericFileIdentityMap is active, the object already in the map for
+        the same row is stored instead.
+        """
+        identity_map = get_current_identity_map()
+        if identity_map is not None and isinstance(value, models.Model):
+            value = identity_map.get(value)
+        self.set_cached_value(instance, value)
+
+    def delete_cached_value(self, instance):
+        cache_name = self.get_cache_name()
+        if django.VERSION > (2, 0):
+            super(GenericForeignFileField, self).delete_cached_value(instance)
+        else:
+            del instance.__dict__[cache_name]
+        self.clear_file_memo(instance)
+
+    def clear_file_memo(self, instance):
+        """
+        Forget that the FieldFile on ``instance`` has been synced with the
+        generic related object, so that the next read re-resolves it.
+        """
+        file_val = instance.__dict__.get(self.file_field_name)
+        if getattr(file_val, '_resolved_instance', None) is not None:
+            file_val._resolved_instance = None
 
     def contribute_to_class(self, cls, name):
         self.generic_rel_name = '%s_generic_rel' % name
@@ -166,6 +278,21 @@ class GenericForeignFileField(GenericRelation):
         # Save a reference to which model this class is on for future use
         self.model = cls
 
+        if self.cache_alias:
+            lazy_related_operation(
+                lambda model, rel_model: register_cached_field(self, rel_model),
+                cls, compat_rel(self).model)
+
+        if self.sync_file_column:
+            lazy_related_operation(
+                lambda model, rel_model: register_synced_field(self, rel_model),
+                cls, compat_rel(self).model)
+
+        if self.auto_prefetch:
+            # Tells the patched QuerySet._fetch_all() to record the peers of
+            # instances of this model (see generic_plus.models)
+            cls._generic_plus_auto_prefetch = True
+
         super(GenericRelation, self).contribute_to_class(cls, name, **{
             ('private_only' if django.VERSION > (1, 10) else 'virtual_only'): True,
         })
@@ -182,6 +309,7 @@ class GenericForeignFileField(GenericRelation):
                 del self.file_kwargs['height_field']
 
         self.__dict__['file_field'] = self.file_field_cls(name=name, **self.file_kwargs)
+        self.file_field.attr_class = generic_field_file_factory(self.file_field.attr_class)
         ### HACK: manually fix creation counter
         self.file_field.creation_counter = self.creation_counter
 
@@ -218,6 +346,11 @@ class GenericForeignFileField(GenericRelation):
         })
         setattr(cls, self.raw_file_field_name, self.file_descriptor_cls(self.file_field))
 
+        # Async counterpart of the file descriptor, for use in async views
+        aget_name = 'aget_%s' % self.file_field_name
+        if aget_name not in cls.__dict__:
+            setattr(cls, aget_name, functools.partialmethod(_aget_generic_file, field=self))
+
     def is_cached(self, instance):
         if django.VERSION > (2, 0):
             return super(GenericForeignFileField, self).is_cached(instance)
@@ -230,45 +363,292 @@ class GenericForeignFileField(GenericRelation):
         return self.get_prefetch_querysets(instances, [queryset])
 
     def get_prefetch_querysets(self, instances, querysets=None):
-        if querysets is not None:
-            raise Exception(
-                "Passing querysets in generic_plus get_prefetch_querysets is "
-                "not yet supported"
-            )
-        models = set([type(i) for i in instances])
-
-        # Handle case where instances are different models (and consequently,
-        # different content types)
-        if len(models) > 1:
-            bulk_qsets = []
-            for model, group in itertools.groupby(instances, type):
-                model_instances = list(group)
-                field = getattr(model, self.name)
-                bulk_qsets.append(field.bulk_related_objects(model_instances))
-            bulk_qset = reduce(operator.or_, bulk_qsets)
-
-            def rel_obj_attr(rel_obj):
-                content_type = getattr(rel_obj, "%s_id" % self.content_type_field_name)
-                object_id = getattr(rel_obj, self.object_id_field_name)
-                return (content_type, object_id)
-
-            def get_ctype_obj_id(obj):
-                field = getattr(obj.__class__, self.name)
-                content_type = ContentType.objects.get_for_model(obj, field.for_concrete_model)
-                return (content_type.pk, obj._get_pk_val())
-
-            return (bulk_qset,
-                rel_obj_attr,
-                get_ctype_obj_id,
-                True,
-                self.attname) + (() if django.VERSION < (2, 0) else (True,))
-
-        return (self.bulk_related_objects(instances),
-            operator.attrgetter(self.object_id_field_name),
-            lambda obj: obj._get_pk_val(),
+        if querysets and len(querysets) != 1:
+            raise ValueError(
+                "querysets argument of get_prefetch_querysets() should have a "
+                "length of 1.")
+        queryset = querysets[0] if querysets else None
+
+        # Group the instances by model (and consequently, by content type),
+        # preserving the order in which each model first appears.
+        instances_by_model = {}
+        for instance in instances:
+            instances_by_model.setdefault(type(instance), []).append(instance)
+
+        rel_qs = self.get_related_queryset(instances, queryset)
+        chunk_size = self.get_prefetch_chunk_size(rel_qs.db)
+
+        # The cache holds the results of the default queryset, so it isn't
+        # read for a Prefetch() queryset
+        use_cache = bool(
+            self.cache_alias and queryset is None and not rel_qs._prefetch_related_lookups)
+        cached = {}
+        if use_cache:
+            for model, model_instances in instances_by_model.items():
+                cached.update(get_cached_related_objects(getattr(model, self.name), model_instances))
+
+        batches, content_type_ids, pk_fields = self.get_related_batches(
+            [(self, instances)], chunk_size, exclude=cached)
+        if batches:
+            bulk_qset = self.filter_related_queryset(rel_qs, batches)
+        else:
+            bulk_qset = rel_qs.none()
+
+        def rel_obj_attr(rel_obj):
+            return self.get_related_object_key(rel_obj, pk_fields)
+
+        def instance_attr(obj):
+            return self.get_instance_key(obj, content_type_ids[obj.__class__])
+
+        if use_cache:
+            self.add_cached_prefetch_results(
+                bulk_qset, instances_by_model, cached, rel_obj_attr, instance_attr)
+        identity_map = get_current_identity_map()
+        if identity_map is not None and not bulk_qset._prefetch_related_lookups:
+            # prefetch_related() assigns the objects of the results, and
+            # runs the lookups through the field on them
+            bulk_qset._result_cache = [identity_map.get(o) for o in bulk_qset]
+        return (bulk_qset,
+            rel_obj_attr,
+            instance_attr,
             True,
             self.attname) + (() if django.VERSION < (2, 0) else (True,))
 
+    def add_cached_prefetch_results(self, rel_qs, instances_by_model, cached,
+            rel_obj_attr, instance_attr):
+        """
+        Evaluate ``rel_qs``, the prefetch queryset of the instances that
+        weren't in the cache, store what it loaded for them in the cache,
+        and add the ``cached`` related objects of the others to its results,
+        which Django's prefetch_related() then reads without a query.
+        """
+        rel_objs = list(rel_qs)
+        loaded = {}
+        for rel_obj in rel_objs:
+            loaded.setdefault(rel_obj_attr(rel_obj), rel_obj)
+        for model, model_instances in instances_by_model.items():
+            store_related_objects(getattr(model, self.name), [
+                (i, loaded.get(instance_attr(i)))
+                for i in model_instances if id(i) not in cached])
+        rel_qs._result_cache = [o for o in cached.values() if o is not None] + rel_objs
+
+    def get_related_batches(self, entries, chunk_size, field_identifiers=None, exclude=()):
+        """
+        Return ``(batches, content_type_ids, pk_fields)`` for loading the
+        related rows of ``entries``, a list of (field, instances) pairs of
+        fields whose rows are in the same table as this field's.
+
+        The instances of each field are grouped by model (and consequently,
+        by content type), preserving the order in which each model first
+        appears, leaving out those whose id() is in ``exclude``. Each batch
+        is a list of filters from get_related_filter() (passed
+        ``field_identifiers``) that match at most ``chunk_size`` object ids
+        in total, for filter_related_queryset(). ``content_type_ids`` maps
+        each model to the id of its content type, and ``pk_fields`` maps
+        each content type id to the primary key of its model, for
+        get_related_object_key().
+        """
+        batches = []
+        batch_size = 0
+        content_type_ids = {}
+        pk_fields = {}
+        for field, instances in entries:
+            instances_by_model = {}
+            for instance in instances:
+                instances_by_model.setdefault(type(instance), []).append(instance)
+            for model, model_instances in instances_by_model.items():
+                model_field = getattr(model, field.name)
+                content_type_id = model_field.get_content_type_id(model_instances[0])
+                content_type_ids[model] = content_type_id
+                pk_fields[content_type_id] = model._meta.pk
+                model_instances = [i for i in model_instances if id(i) not in exclude]
+                if not model_instances:
+                    continue
+                for chunk in chunked(model_instances, chunk_size):
+                    if not batches or (chunk_size and batch_size + len(chunk) > chunk_size):
+                        batches.append([])
+                        batch_size = 0
+                    batches[-1].append(model_field.get_related_filter(
+                        chunk, field_identifiers=field_identifiers,
+                        content_type_id=content_type_id))
+                    batch_size += len(chunk)
+        return batches, content_type_ids, pk_fields
+
+    def get_related_object_key(self, rel_obj, pk_fields):
+        """
+        Return the (content type id, object id, field identifier) of
+        ``rel_obj``, a generic related row, to match it with the key of the
+        instance it points to (see get_instance_key()).
+
+        The object id is converted to the type of the primary key of the
+        model it points to, from ``pk_fields`` (see get_related_batches()),
+        to match ``_get_pk_val()`` (e.g. a CharField object id of a model
+        with a UUID primary key).
+        """
+        content_type_id = getattr(rel_obj, '%s_id' % self.content_type_field_name)
+        field_identifier = None
+        if self.field_identifier_field_name:
+            field_identifier = getattr(rel_obj, self.field_identifier_field_name)
+        return (
+            content_type_id,
+            self.to_pk_value(
+                pk_fields.get(content_type_id), getattr(rel_obj, self.object_id_field_name)),
+            field_identifier,
+        )
+
+    def get_instance_key(self, instance, content_type_id=None):
+        """
+        Return the key (see get_related_object_key()) of the related row of
+        this field for ``instance``.
+        """
+        if content_type_id is None:
+            content_type_id = self.get_content_type_id(instance)
+        field_identifier = self.field_identifier if self.field_identifier_field_name else None
+        return (content_type_id, instance._get_pk_val(), field_identifier)
+
+    def to_pk_value(self, pk_field, object_id):
+        """
+        Convert ``object_id``, the object id of a generic related row, to the
+        Python type of ``pk_field``, the primary key of the model it points
+        to, so that it can be compared with the primary keys of instances.
+        """
+        if pk_field is None or object_id is None:
+            return object_id
+        try:
+            return pk_field.to_python(object_id)
+        except (TypeError, ValueError, ValidationError):
+            return object_id
+
+    def get_prefetch_chunk_size(self, using):
+        """
+        Return the maximum number of object ids to filter on in a single
+        query when loading related rows on database ``using``, or None for no
+        limit.
+        """
+        if self.prefetch_chunk_size:
+            return self.prefetch_chunk_size
+        max_query_params = connections[using].features.max_query_params
+        if not max_query_params:
+            return None
+        # Leave room for the other parameters of the query (content types,
+        # field identifiers and the filters of a Prefetch queryset)
+        return max(max_query_params // 2, 1)
+
+    def filter_related_queryset(self, queryset, batches):
+        """
+        Filter ``queryset`` with ``batches``, a list of lists of Q objects
+        (from get_related_filter()), with the filters of each batch OR'd
+        together.
+
+        If there is more than one batch, a query is run for each of them and
+        the combined rows are stored as the result cache of the returned
+        queryset, which keeps any prefetch_related() lookups of ``queryset``.
+        """
+        if len(batches) == 1:
+            return self.get_batch_querysets(queryset, batches)[0]
+        rel_objs = []
+        for batch_qs in self.get_batch_querysets(queryset.prefetch_related(None), batches):
+            rel_objs.extend(batch_qs)
+        # The returned queryset is never evaluated against the database,
+        # so it doesn't need to be filtered.
+        queryset = queryset._chain()
+        queryset._result_cache = rel_objs
+        return queryset
+
+    def get_batch_querysets(self, queryset, batches):
+        """
+        Return a queryset for each of ``batches`` (see filter_related_queryset()),
+        filtered from ``queryset``.
+        """
+        return [queryset.filter(reduce(operator.or_, batch)) for batch in batches]
+
+    def get_related_queryset(self, instances, queryset=None):
+        """
+        Return the queryset of the generic related model that prefetches for
+        ``instances`` are filtered from: either ``queryset`` (e.g. from a
+        Prefetch object) or all rows of the related model.
+        """
+        if queryset is None:
+            queryset = self.apply_related_only(compat_rel_to(self)._base_manager.all())
+        queryset._add_hints(instance=instances[0])
+        return queryset.using(
+            queryset._db or router.db_for_read(
+                queryset.model, instance=instances[0], **{READ_HINT: True}))
+
+    def get_content_type_id(self, instance):
+        """
+        Return the id of the ContentType that the generic related rows of
+        ``instance`` point to.
+        """
+        return content_types.get_id(
+            instance, for_concrete_model=self.for_concrete_model, using=instance._state.db)
+
+    def get_related_filter(self, instances, field_identifiers=None, content_type_id=None,
+            object_ids=None):
+        """
+        Return a Q object matching the generic related rows of ``instances``,
+        which must all be instances of the model this field is attached to.
+
+        If ``field_identifiers`` is passed, rows for any of those field
+        identifiers are matched instead of only this field's. If
+        ``object_ids`` is passed (for instance, a ``values('pk')`` queryset
+        to use as a subquery), it is matched instead of the primary keys of
+        ``instances``.
+        """
+        if content_type_id is None:
+            content_type_id = self.get_content_type_id(instances[0])
+        if object_ids is None:
+            object_ids = set(obj._get_pk_val() for obj in instances)
+        q = models.Q(**{
+            "%s__pk" % self.content_type_field_name: content_type_id,
+            "%s__in" % self.object_id_field_name: object_ids,
+        })
+        if self.field_identifier_field_name:
+            if field_identifiers is None:
+                q &= models.Q(**{
+                    "%s__exact" % self.field_identifier_field_name: self.field_identifier,
+                })
+            else:
+                q &= models.Q(**{
+                    "%s__in" % self.field_identifier_field_name: set(field_identifiers),
+                })
+        return q
+
+    def get_combined_prefetch_key(self):
+        """
+        GenericForeignFileFields on the same model with equal keys store
+        their rows in the same table, distinguished only by field identifier,
+        so they can be prefetched with a single query.
+        """
+        if not self.field_identifier_field_name:
+            return (self,)
+        return (
+            compat_rel_to(self),
+            self.content_type_field_name,
+            self.object_id_field_name,
+            self.field_identifier_field_name,
+            self.for_concrete_model,
+        )
+
+    def bulk_fill_cache(self, instances):
+        """
+        Load the generic related objects of ``instances`` in one query and
+        store them in the field cache of each instance.
+
+        The FieldFile of each instance is synced with its related object
+        the next time the field is read.
+        """
+        # get_prefetch_querysets() reads and fills the cache of a cache_alias
+        instances = [i for i in instances if i._get_pk_val() is not None]
+        if not instances:
+            return
+        rel_qs, rel_obj_attr, instance_attr = self.get_prefetch_querysets(instances)[:3]
+        rel_obj_cache = {}
+        for rel_obj in rel_qs:
+            rel_obj_cache.setdefault(rel_obj_attr(rel_obj), rel_obj)
+        for instance in instances:
+            self.set_loaded_value(instance, rel_obj_cache.get(instance_attr(instance)))
+
     def bulk_related_objects(self, *args, **kwargs):
         """
         Return all objects related to ``objs`` via this ``GenericRelation``.
@@ -277,7 +657,141 @@ class GenericForeignFileField(GenericRelation):
         qs = super(GenericForeignFileField, self).bulk_related_objects(*args, **kwargs)
         if self.field_identifier_field_name:
             qs = qs.filter(**{"%s__exact" % self.field_identifier_field_name: self.field_identifier})
-        return qs
+        return self.apply_related_only(qs)
+
+    def bulk_create_with_files(self, parents, files, using=None, batch_size=None):
+        """
+        Insert the unsaved instances ``parents`` along with their generic
+        related rows for this field, in a single transaction.
+
+        ``files`` holds the file of each parent, in the same order: an
+        unsaved instance of the related model, a file path (for which a
+        related object is created), or None. Uncommitted files are saved to
+        storage first, then the file column of each parent is set before the
+        parents are inserted, and the related rows are inserted with one
+        bulk_create() once the parents have primary keys. The related
+        objects are stored in the field cache of the parents.
+
+        As with bulk_create(), the save() methods of the parents and of the
+        related objects are not called. On backends that can't return the
+        primary keys of bulk inserted rows, the keys of parents with an auto
+        incremented primary key are selected after the insert (see
+        _bulk_create_auto_pk()), which fails if other connections insert
+        parent rows at the same time.
+        """
+        parents = list(parents)
+        files = list(files)
+        if len(parents) != len(files):
+            raise ValueError("bulk_create_with_files() requires a file (or None) for each parent")
+        if not parents:
+            return parents
+
+        parent_model = parents[0].__class__
+        rel_model = compat_rel_to(self)
+        rel_file_field = rel_model._meta.get_field(self.rel_file_field_name)
+        using = using or router.db_for_write(parent_model)
+
+        rel_objs = []
+        for parent, rel_obj in zip(parents, files):
+            if rel_obj is not None and not isinstance(rel_obj, rel_model):
+                rel_obj = rel_model(**{self.rel_file_field_name: rel_obj})
+            path = None
+            if rel_obj is not None:
+                # Commits the file to storage, which may change its name
+                path = rel_file_field.pre_save(rel_obj, True).name
+            setattr(parent, self.file_field_name, path or '')
+            rel_objs.append(rel_obj)
+
+        with transaction.atomic(using=using, savepoint=False):
+            parent_manager = parent_model._base_manager.using(using)
+            if can_return_bulk_insert_pks(connections[using]):
+                parent_manager.bulk_create(parents, batch_size=batch_size)
+            else:
+                parent_manager.bulk_create(
+                    [p for p in parents if p._get_pk_val() is not None],
+                    batch_size=batch_size)
+                self._bulk_create_auto_pk(
+                    parent_manager, [p for p in parents if p._get_pk_val() is None],
+                    batch_size)
+
+            content_type = content_types.get_for_model(
+                parent_model, for_concrete_model=self.for_concrete_model, using=using)
+            new_rel_objs = []
+            for parent, rel_obj in zip(parents, rel_objs):
+                if rel_obj is None:
+                    continue
+                setattr(rel_obj, self.content_type_field_name, content_type)
+                setattr(rel_obj, self.object_id_field_name, parent._get_pk_val())
+                if self.field_identifier_field_name:
+                    setattr(rel_obj, self.field_identifier_field_name, self.field_identifier)
+                new_rel_objs.append(rel_obj)
+            rel_model._base_manager.using(using).bulk_create(new_rel_objs, batch_size=batch_size)
+
+        for parent, rel_obj in zip(parents, rel_objs):
+            self.set_cached_value(parent, rel_obj)
+        return parents
+
+    def _bulk_create_auto_pk(self, manager, objs, batch_size=None):
+        """
+        Insert ``objs`` with bulk_create() and set their auto incremented
+        primary keys, for backends that don't return them: the keys above
+        the highest one before the insert are selected, in insertion order.
+
+        The table isn't locked, so rows that other connections insert in the
+        meantime are selected too. DatabaseError is then raised, from the
+        number of keys, which rolls back bulk_create_with_files(); inserts
+        that may run concurrently must be serialized by the caller (e.g.
+        with a lock).
+        """
+        if not objs:
+            return
+        pk_field = manager.model._meta.pk
+        max_pk = manager.aggregate(max_pk=models.Max(pk_field.attname))['max_pk']
+        manager.bulk_create(objs, batch_size=batch_size)
+        queryset = manager.order_by(pk_field.attname)
+        if max_pk is not None:
+            queryset = queryset.filter(pk__gt=max_pk)
+        pks = list(queryset.values_list(pk_field.attname, flat=True)[:len(objs) + 1])
+        if len(pks) != len(objs):
+            raise DatabaseError(
+                "Could not select the primary keys of the %d inserted %s rows "
+                "(were rows inserted concurrently?)"
+                % (len(objs), manager.model._meta.object_name))
+        for obj, pk in zip(objs, pks):
+            setattr(obj, pk_field.attname, pk)
+
+    def get_related_only_fields(self):
+        """
+        Return the names of the related model's fields that are loaded for
+        this field, or None if all of them are.
+        """
+        if not self.related_only:
+            return None
+        required = [
+            compat_rel_to(self)._meta.pk.name,
+            self.content_type_field_name,
+            self.object_id_field_name,
+            self.field_identifier_field_name,
+            self.rel_file_field_name,
+        ]
+        field_names = list(self.related_only)
+        for name in required:
+            if name and name not in field_names:
+                field_names.append(name)
+        return tuple(field_names)
+
+    def apply_related_only(self, queryset):
+        """
+        Restrict ``queryset`` to the fields in ``related_only``, unless the
+        queryset already defers or restricts fields of its own.
+        """
+        field_names = self.get_related_only_fields()
+        if field_names is None:
+            return queryset
+        existing, defer = queryset.query.deferred_loading
+        if existing or not defer:
+            return queryset
+        return queryset.only(*field_names)
 
     def save_form_data(self, instance, data):
         super(GenericForeignFileField, self).save_form_data(instance, data)
@@ -298,13 +812,25 @@ class GenericForeignFileField(GenericRelation):
         # sure that it's saved.
         if isinstance(data, UploadedFile):
             if value and isinstance(value, FieldFile) and not value._committed:
-                # save=True saves the instance. Since this field (GenericForeignFileField)
-                # is considered a "related field" by Django, its save_form_data()
-                # gets called after the instance has already been saved. We need
-                # to resave it if we have a new file.
-                value.save(value.name, value, save=True)
+                # Since this field (GenericForeignFileField) is considered a
+                # "related field" by Django, its save_form_data() gets called
+                # after the instance has already been saved. We need to
+                # resave it if we have a new file.
+                value.save(value.name, value, save=False)
+                self.save_file_column(instance)
         else:
-            instance.save()
+            self.save_file_column(instance)
+
+    def save_file_column(self, instance):
+        """
+        Save the file column of ``instance`` for this field, or, within
+        coalesce_file_saves(), add it to the columns saved on exit.
+        """
+        pending = instance.__dict__.get('_generic_plus_pending_file_saves')
+        if pending is None:
+            instance.save(update_fields=[self.file_field.name])
+        elif self.file_field.name not in pending:
+            pending.append(self.file_field.name)
 
     def formfield(self, **kwargs):
         factory_kwargs = {'related': compat_rel(self)}
@@ -388,6 +914,203 @@ class GenericForeignFileField(GenericRelation):
         return attname, column
 
 
+async def _aget_generic_file(instance, field):
+    return await field.file_descriptor.aget(instance)
+
+
+@contextlib.contextmanager
+def coalesce_file_saves(instance):
+    """
+    Collect the file columns that the GenericForeignFileFields of
+    ``instance`` save in save_form_data(), and save all of them with a
+    single ``instance.save(update_fields=[...])`` on exit.
+
+    ModelForms enter this around saving their related fields, so that a
+    model with several GenericForeignFileFields is only saved once.
+    """
+    if '_generic_plus_pending_file_saves' in instance.__dict__:
+        yield
+        return
+    pending = instance.__dict__['_generic_plus_pending_file_saves'] = []
+    try:
+        yield
+    finally:
+        del instance.__dict__['_generic_plus_pending_file_saves']
+    if pending:
+        instance.save(update_fields=pending)
+
+
+class GenericFieldFileMixin(object):
+    """
+    Mixed into the ``attr_class`` (FieldFile, ImageFieldFile, ...) of the
+    FileField that GenericForeignFileField adds to its model.
+
+    Adds a ``related_object`` attribute, which can be resolved lazily.
+    """
+
+    base_attr_class = None
+
+    _related_object = None
+    _related_object_loader = None
+    _resolved_instance = None
+    # (name, url, expiry time or None)
+    _url_memo = None
+
+    @property
+    def related_object(self):
+        if self._related_object_loader is not None:
+            loader = self._related_object_loader
+            self._related_object_loader = None
+            self._related_object = loader()
+        return self._related_object
+
+    @related_object.setter
+    def related_object(self, value):
+        self._related_object_loader = None
+        self._related_object = value
+
+    @property
+    def url(self):
+        memo = self._url_memo
+        if memo is not None and memo[0] == self.name and (
+                memo[2] is None or memo[2] > time.monotonic()):
+            return memo[1]
+        url = super(GenericFieldFileMixin, self).url
+        if self.get_url_cache_ttl() is not None:
+            self.memoize_url(url)
+        return url
+
+    def get_url_cache_ttl(self):
+        return getattr(getattr(self.field, 'db_field', None), 'url_cache_ttl', None)
+
+    def memoize_url(self, url):
+        """
+        Store ``url`` as the URL of the current file, for the field's
+        ``url_cache_ttl`` or, if it is None, until the file name changes.
+        """
+        ttl = self.get_url_cache_ttl()
+        expires = time.monotonic() + ttl if ttl is not None else None
+        self._url_memo = (self.name, url, expires)
+
+    def defer_related_object(self, loader):
+        """
+        Set a callable that returns the related object, to be called on
+        first access of ``related_object``.
+        """
+        self._related_object_loader = loader
+
+    def __reduce__(self):
+        # The class itself is generated by generic_field_file_factory(), so
+        # it can't be pickled by reference.
+        return (_unpickle_generic_field_file, (self.base_attr_class,), self.__getstate__())
+
+    def __getstate__(self):
+        # The same state as Django's FieldFile (from 3.1 on). The related
+        # object, its loader and the memoized URL are left out; the related
+        # object is restored from the field cache of the instance.
+        #
+        # Fields are pickled by model and name, and the name of the FileField
+        # resolves to its GenericForeignFileField, so that is pickled instead.
+        return {
+            'name': self.name,
+            'closed': False,
+            '_committed': True,
+            '_file': None,
+            'instance': self.instance,
+            'field': getattr(self.field, 'db_field', self.field),
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.field, GenericForeignFileField):
+            self.field = self.field.file_field
+        self.storage = self.field.storage
+
+
+class CompactRelatedObject(object):
+    """
+    Stands in for the generic related object in the field cache of a
+    pickled model instance. Only the related model, database and loaded
+    column values are pickled, and the object is rebuilt from them the first
+    time the field cache is read after unpickling.
+    """
+
+    __slots__ = ('model', 'db', 'attnames', 'values')
+
+    def __init__(self, model, db, attnames, values):
+        self.model = model
+        self.db = db
+        self.attnames = attnames
+        self.values = values
+
+    @classmethod
+    def from_object(cls, obj):
+        attnames, values = dump_related_object(obj)
+        return cls(type(obj), obj._state.db, attnames, values)
+
+    def load(self):
+        return self.model.from_db(self.db, self.attnames, self.values)
+
+    def __reduce__(self):
+        return (CompactRelatedObject, (self.model, self.db, self.attnames, self.values))
+
+
+_generic_field_file_classes = {}
+
+
+def generic_field_file_factory(attr_class):
+    """
+    Return a subclass of ``attr_class`` that includes GenericFieldFileMixin.
+    The generated class is cached per ``attr_class``.
+    """
+    if issubclass(attr_class, GenericFieldFileMixin):
+        return attr_class
+    try:
+        return _generic_field_file_classes[attr_class]
+    except KeyError:
+        pass
+    cls = type(attr_class.__name__, (GenericFieldFileMixin, attr_class), {
+        '__module__': GenericFieldFileMixin.__module__,
+        'base_attr_class': attr_class,
+    })
+    _generic_field_file_classes[attr_class] = cls
+    return cls
+
+
+def _unpickle_generic_field_file(attr_class):
+    cls = generic_field_file_factory(attr_class)
+    return cls.__new__(cls)
+
+
+class QuerysetPeers(object):
+    """
+    Weak references to the model instances loaded by a single queryset
+    evaluation, shared by each of those instances.
+
+    Used by GenericForeignFileFields with ``auto_prefetch=True``. Peers are
+    deliberately not pickled.
+    """
+
+    def __init__(self, instances):
+        self.refs = [weakref.ref(instance) for instance in instances]
+
+    def __iter__(self):
+        for ref in self.refs:
+            instance = ref()
+            if instance is not None:
+                yield instance
+
+    def __reduce__(self):
+        return (QuerysetPeers, ([],))
+
+
+GenericForeignFileAccessPlan = namedtuple('GenericForeignFileAccessPlan', [
+    'rel_model', 'superclass', 'manager_cls', 'source_col_name',
+    'target_col_name', 'content_type_filter', 'object_id_filter',
+    'field_identifier_filters', 'prefetch_cache_name', 'file_cache_name',
+])
+
+
 class GenericForeignFileDescriptor(object):
 
     def __init__(self, field, file_field, is_file_field=False, for_concrete_model=True):
@@ -395,27 +1118,32 @@ class GenericForeignFileDescriptor(object):
         self.file_field = file_field
         self.is_file_field = is_file_field
         self.for_concrete_model = for_concrete_model
+        self._access_plans = {}
 
-    def __get__(self, instance, instance_type=None):
-        if instance is None:
-            return self.field
+    def get_access_plan(self, instance):
+        """
+        Return the GenericForeignFileAccessPlan for ``instance``.
 
-        file_val = None
+        Everything in the plan depends only on the model class, the field and
+        the database vendor (for column quoting), so it is computed on first
+        access and reused for every later ``__get__``. Plans are keyed on the
+        database alias, which always maps to a single vendor and is cheaper
+        to look up than the connection itself.
+        """
+        key = (instance.__class__, instance._state.db)
+        try:
+            return self._access_plans[key]
+        except KeyError:
+            pass
 
-        if self.is_file_field:
-            file_val = instance.__dict__[self.file_field.name]
+        conn = connections[instance._state.db or DEFAULT_DB_ALIAS]
 
         # Dynamically create a class that subclasses the related model's
         # default manager.
         rel_model = compat_rel_to(self.field)
         superclass = rel_model._default_manager.__class__
-        RelatedManager = create_generic_related_manager(superclass)
-
-        qn = connection.ops.quote_name
 
-        manager_kwargs = {
-            'prefetch_cache_name': self.field.attname,
-        }
+        qn = conn.ops.quote_name
 
         if hasattr(self.field, "get_joining_fields"):
             join_cols = tuple(
@@ -427,41 +1155,211 @@ class GenericForeignFileDescriptor(object):
         else:
             join_cols = self.field.get_joining_columns(reverse_join=True)[0]
 
-        ct_manager = ContentType.objects.db_manager(instance._state.db)
-        content_type = ct_manager.get_for_model(instance, for_concrete_model=self.for_concrete_model)
+        field_identifier_filters = {}
+        field_identifier_field_name = self.field.field_identifier_field_name
+        if field_identifier_field_name:
+            field_identifier_filters['%s__exact' % field_identifier_field_name] = getattr(
+                self.field, field_identifier_field_name)
 
-        manager = RelatedManager(
-            model=rel_model,
-            instance=instance,
-            field=self.field,
+        plan = GenericForeignFileAccessPlan(
+            rel_model=rel_model,
+            superclass=superclass,
+            manager_cls=create_generic_related_manager(superclass),
             source_col_name=qn(join_cols[0]),
             target_col_name=qn(join_cols[1]),
+            content_type_filter='%s__pk' % self.field.content_type_field_name,
+            object_id_filter='%s__exact' % self.field.object_id_field_name,
+            field_identifier_filters=field_identifier_filters,
+            prefetch_cache_name=self.field.attname,
+            file_cache_name=self.file_field.name)
+        self._access_plans[key] = plan
+        return plan
+
+    def get_manager(self, instance, plan=None):
+        plan = plan or self.get_access_plan(instance)
+        content_type = content_types.get_for_model(
+            instance, for_concrete_model=self.for_concrete_model, using=instance._state.db)
+        return plan.manager_cls(
+            model=plan.rel_model,
+            instance=instance,
+            field=self.field,
+            source_col_name=plan.source_col_name,
+            target_col_name=plan.target_col_name,
             content_type=content_type,
             content_type_field_name=self.field.content_type_field_name,
             object_id_field_name=self.field.object_id_field_name,
             field_identifier_field_name=self.field.field_identifier_field_name,
-            **manager_kwargs)
+            prefetch_cache_name=plan.prefetch_cache_name,
+            plan=plan)
 
-        if not manager.pk_val:
-            val = None
-        else:
-            if not self.is_file_field:
+    def __get__(self, instance, instance_type=None):
+        if instance is None:
+            return self.field
+
+        file_val = None
+
+        if self.is_file_field:
+            file_val = instance.__dict__[self.file_field.name]
+            # A FieldFile that was already synced with the cached related
+            # object is returned as-is. The marker is cleared whenever the
+            # file value or the cached related object changes, and it is not
+            # pickled along with the FieldFile.
+            if getattr(file_val, '_resolved_instance', None) is instance:
+                return file_val
+
+        plan = self.get_access_plan(instance)
+
+        if not self.is_file_field:
+            manager = self.get_manager(instance, plan)
+            if manager.pk_val:
                 return manager
+            return instance.__dict__[plan.file_cache_name]
+
+        if not instance._get_pk_val():
+            return file_val
+
+        if (isinstance(file_val, GenericFieldFileMixin)
+                and not self.field.is_cached(instance)):
+            loader = get_current_loader()
+            if loader is not None:
+                # Serve the file path stored on the instance, and load the
+                # related object along with those of the other instances
+                # registered with the loader once it is needed.
+                loader.add(instance, self.field)
+                file_val.defer_related_object(
+                    functools.partial(loader.load, instance, self.field))
+                file_val._resolved_instance = instance
+                return file_val
+            if self.field.lazy_related_object:
+                # Serve the file path stored on the instance, and only query
+                # for the related object when FieldFile.related_object is
+                # accessed.
+                file_val.defer_related_object(
+                    functools.partial(self.get_related_object, instance, plan))
+                file_val._resolved_instance = instance
+                return file_val
+
+        val = self.get_related_object(instance, plan)
+        self.set_file_value(instance, file_val, obj=val)
+        file_val = instance.__dict__[plan.file_cache_name]
+        if isinstance(file_val, FieldFile):
+            file_val._resolved_instance = instance
+        return file_val
+
+    def get_related_object(self, instance, plan=None):
+        """
+        Return the generic related object for ``instance`` (or None if there
+        isn't one), querying for it and caching it if it is not yet cached.
+        """
+        try:
+            return self.field.get_cached_value(instance)
+        except KeyError:
+            pass
 
+        if self.field.auto_prefetch:
+            self.auto_prefetch(instance)
             try:
-                val = self.field.get_cached_value(instance)
+                return self.field.get_cached_value(instance)
             except KeyError:
-                db = manager._db or router.db_for_read(rel_model, instance=instance)
-                qset = superclass.get_queryset(manager).using(db)
+                pass
+
+        found = get_cached_related_objects(self.field, [instance])
+        if found:
+            self.field.set_loaded_value(instance, found[id(instance)])
+            return self.field.get_cached_value(instance)
+
+        plan = plan or self.get_access_plan(instance)
+        manager = self.get_manager(instance, plan)
+        db = manager._db or router.db_for_read(
+            plan.rel_model, instance=instance, **{READ_HINT: True})
+        qset = self.field.apply_related_only(
+            plan.superclass.get_queryset(manager).using(db))
+
+        try:
+            val = qset.get(**manager.core_filters)
+        except plan.rel_model.DoesNotExist:
+            val = None
+
+        self.field.set_loaded_value(instance, val)
+        cache_related_objects(self.field, [instance])
+        return self.field.get_cached_value(instance)
 
-                try:
-                    val = qset.get(**manager.core_filters)
-                except rel_model.DoesNotExist:
-                    val = None
+    async def aget(self, instance):
+        """
+        Async counterpart of accessing the field on ``instance``: the
+        related object is loaded with the async ORM if it isn't cached yet
+        (also if the field has ``lazy_related_object=True``).
+        """
+        if instance._get_pk_val() is not None:
+            await self.aget_related_object(instance)
+        return self.__get__(instance)
+
+    async def aget_related_object(self, instance, plan=None):
+        """Async counterpart of get_related_object()."""
+        try:
+            return self.field.get_cached_value(instance)
+        except KeyError:
+            pass
+
+        if self.field.auto_prefetch:
+            await self.aauto_prefetch(instance)
+            try:
+                return self.field.get_cached_value(instance)
+            except KeyError:
+                pass
+
+        # Load the content type before get_manager() and the cache keys,
+        # which look it up synchronously
+        await content_types.aget_for_model(
+            instance, for_concrete_model=self.for_concrete_model, using=instance._state.db)
+
+        found = await aget_cached_related_objects(self.field, [instance])
+        if found:
+            self.field.set_loaded_value(instance, found[id(instance)])
+            return self.field.get_cached_value(instance)
+
+        plan = plan or self.get_access_plan(instance)
+        manager = self.get_manager(instance, plan)
+        db = manager._db or router.db_for_read(
+            plan.rel_model, instance=instance, **{READ_HINT: True})
+        qset = self.field.apply_related_only(
+            plan.superclass.get_queryset(manager).using(db))
+
+        try:
+            val = await qset.aget(**manager.core_filters)
+        except plan.rel_model.DoesNotExist:
+            val = None
+
+        self.field.set_loaded_value(instance, val)
+        await acache_related_objects(self.field, [instance])
+        return self.field.get_cached_value(instance)
+
+    def auto_prefetch(self, instance):
+        """
+        Fill the field cache of ``instance`` and of every other instance
+        loaded by the same queryset that has not yet been resolved.
+        """
+        peers = instance.__dict__.get('_generic_plus_peers')
+        if peers is None:
+            return
+        self.field.bulk_fill_cache([
+            peer for peer in peers
+            if peer._state.db == instance._state.db and not self.field.is_cached(peer)])
 
-            self.set_file_value(instance, file_val, obj=val)
-            self.field.set_cached_value(instance, val)
-        return instance.__dict__[self.file_field.name]
+    async def aauto_prefetch(self, instance):
+        """
+        Async counterpart of auto_prefetch(). Peers are recorded for
+        instances loaded with ``async for`` (which fetches the results with
+        QuerySet._fetch_all() in a thread), not for those loaded with
+        ``aiterator()``, which, like ``iterator()``, keeps no result cache.
+        """
+        peers = instance.__dict__.get('_generic_plus_peers')
+        if peers is None:
+            return
+        await aprefetch_generic_files([
+            peer for peer in peers
+            if peer._state.db == instance._state.db and not self.field.is_cached(peer)
+        ], self.field.name)
 
     def set_file_value(self, instance, value, obj=None):
         # Sort out what to do with the file_val
@@ -525,6 +1423,7 @@ class GenericForeignFileDescriptor(object):
 
         if self.is_file_field:
             self.set_file_value(instance, value)
+            self.field.clear_file_memo(instance)
         else:
             manager = self.__get__(instance)
             manager.clear()
@@ -534,21 +1433,30 @@ class GenericForeignFileDescriptor(object):
                 rel_obj_file = getattr(value, self.field.rel_file_field_name)
                 file_val = rel_obj_file.path if rel_obj_file else None
                 setattr(instance, self.field.file_field_name, file_val)
-                manager.add(value)
+                manager.add(value, bulk=False)
             else:
                 for obj in value:
                     field_value = getattr(obj, self.field.file_field_name)
                     file_val = field_value.path if field_value else None
                     setattr(instance, self.field.file_field_name, file_val)
-                    manager.add(obj)
+                    manager.add(obj, bulk=False)
                 self.field.set_cached_value(instance, value)
 
 
+_generic_related_managers = {}
+
+
 def create_generic_related_manager(superclass):
     """
     Factory function for a manager that subclasses 'superclass' (which is a
     Manager) and adds behavior for generic related objects.
+
+    The generated class is cached per ``superclass``.
     """
+    try:
+        return _generic_related_managers[superclass]
+    except KeyError:
+        pass
 
     class GenericRelatedObjectManager(superclass):
 
@@ -556,7 +1464,7 @@ def create_generic_related_manager(superclass):
                      source_col_name=None, target_col_name=None, content_type=None,
                      content_type_field_name=None, object_id_field_name=None,
                      prefetch_cache_name=None,
-                     field_identifier_field_name=None, **kwargs):
+                     field_identifier_field_name=None, plan=None, **kwargs):
             super(GenericRelatedObjectManager, self).__init__()
             self.model = model
             self.content_type = content_type
@@ -564,18 +1472,26 @@ def create_generic_related_manager(superclass):
             self.instance = instance
             self._field = kwargs.pop('field', None)
             self.file_field_name = self._field.file_field_name
-            self.core_filters = {
-                '%s__pk' % content_type_field_name: content_type.id,
-                '%s__exact' % object_id_field_name: instance._get_pk_val(),
-            }
-            if field_identifier_field_name:
-                self.core_filters['%s__exact' % field_identifier_field_name] = getattr(self._field, field_identifier_field_name)
+            if plan is not None:
+                self.core_filters = {
+                    plan.content_type_filter: content_type.id,
+                    plan.object_id_filter: instance._get_pk_val(),
+                }
+                self.core_filters.update(plan.field_identifier_filters)
+            else:
+                self.core_filters = {
+                    '%s__pk' % content_type_field_name: content_type.id,
+                    '%s__exact' % object_id_field_name: instance._get_pk_val(),
+                }
+                if field_identifier_field_name:
+                    self.core_filters['%s__exact' % field_identifier_field_name] = getattr(self._field, field_identifier_field_name)
 
             self.prefetch_cache_name = prefetch_cache_name
             self.source_col_name = source_col_name
             self.target_col_name = target_col_name
             self.content_type_field_name = content_type_field_name
             self.object_id_field_name = object_id_field_name
+            self.field_identifier_field_name = field_identifier_field_name
             self.pk_val = self.instance._get_pk_val()
 
         def get_queryset(self):
@@ -583,19 +1499,22 @@ def create_generic_related_manager(superclass):
                 return self.instance._prefetched_objects_cache[self.prefetch_cache_name]
             except (AttributeError, KeyError):
                 pass
-            db = self._db or router.db_for_read(self.model, instance=self.instance)
-            query = {
-                ('%s__pk' % self.content_type_field_name): self.content_type.id,
-                ('%s__exact' % self.object_id_field_name): self.pk_val,
-            }
-            return superclass.get_queryset(self).using(db).filter(**query)
+            db = self._db or router.db_for_read(
+                self.model, instance=self.instance, **{READ_HINT: True})
+            # The core filters include the field identifier, which keeps the
+            # rows of the other fields of the instance out
+            return superclass.get_queryset(self).using(db).filter(**self.core_filters)
 
         def get_prefetch_queryset(self, instances, queryset=None):
-            db = self._db or router.db_for_read(self.model, instance=instances[0])
+            db = self._db or router.db_for_read(
+                self.model, instance=instances[0], **{READ_HINT: True})
             query = {
                 ('%s__pk' % self.content_type_field_name): self.content_type.id,
                 ('%s__in' % self.object_id_field_name): set(obj._get_pk_val() for obj in instances),
             }
+            if self.field_identifier_field_name:
+                query['%s__exact' % self.field_identifier_field_name] = getattr(
+                    self._field, self.field_identifier_field_name)
             qs = super(GenericRelatedObjectManager, self).get_queryset()
             return (qs.using(db).filter(**query),
                     operator.attrgetter(self.object_id_field_name),
@@ -603,57 +1522,142 @@ def create_generic_related_manager(superclass):
                     False,
                     self.prefetch_cache_name) + (() if django.VERSION < (2, 0) else (False,))
 
-        def add(self, *objs):
+        def get_generic_keys(self):
+            """
+            Return the values of the fields of related objects that point
+            them at the instance.
+            """
+            keys = {
+                self.content_type_field_name: self.content_type,
+                self.object_id_field_name: self.pk_val,
+            }
+            if self.field_identifier_field_name:
+                keys[self.field_identifier_field_name] = getattr(
+                    self._field, self.field_identifier_field_name)
+            return keys
+
+        def add(self, *objs, **kwargs):
+            """
+            Point ``objs`` at the instance, and store the path of the last of
+            them in the file column of the instance.
+
+            With ``bulk=True`` (the default), the objects are updated with a
+            single query, so their save() methods are not called; they must
+            already be saved. With ``bulk=False``, each object is saved.
+            """
+            bulk = kwargs.pop('bulk', True)
+            db = router.db_for_write(self.model, instance=self.instance)
+            keys = self.get_generic_keys()
             for obj in objs:
                 if not isinstance(obj, self.model):
                     raise TypeError("'%s' instance expected" % self.model._meta.object_name)
-                setattr(obj, self.content_type_field_name, self.content_type)
-                setattr(obj, self.object_id_field_name, self.pk_val)
-                obj.save()
-                related_obj = self.__get_related_obj()
-                setattr(related_obj, self.file_field_name, obj.path)
+                if bulk and (obj._state.adding or obj._state.db != db):
+                    raise ValueError(
+                        "%r instance isn't saved. Use bulk=False or save "
+                        "the object first." % obj)
+
+            with transaction.atomic(using=db, savepoint=False):
+                if bulk:
+                    # The update sends no signals, so the cache entries of
+                    # the instances the objects pointed at are dropped here
+                    invalidate_related_objects(self._field, objs, db)
+                    self.model._base_manager.using(db).filter(
+                        pk__in=[obj.pk for obj in objs]).update(**keys)
+                for obj in objs:
+                    for name, value in keys.items():
+                        setattr(obj, name, value)
+                    if not bulk:
+                        obj.save(using=db)
+                if objs:
+                    self.__update_file_column(objs[-1])
+            self.__invalidate_cache(db)
         add.alters_data = True
 
         @property
         def field(self):
-            related_obj = self.__get_related_obj()
-            return related_obj._meta.get_field(self.file_field_name)
-
-        def __get_related_obj(self):
-            related_cls = self.content_type.model_class()
-            related_obj = related_cls.objects.get(pk=self.pk_val)
-            return related_obj
-
-        def remove(self, *objs):
+            return self.instance._meta.get_field(self.file_field_name)
+
+        def __get_file_column_queryset(self):
+            instance_cls = self.instance.__class__
+            db = router.db_for_write(instance_cls, instance=self.instance)
+            return instance_cls._base_manager.using(db).filter(pk=self.pk_val)
+
+        def __update_file_column(self, rel_obj, update=True):
+            """
+            Store the path of ``rel_obj`` (or '' if it is None) in the file
+            column of the instance, with a single UPDATE query unless
+            ``update`` is False, and ``rel_obj`` in its field cache.
+            """
+            path = (rel_obj.path if rel_obj is not None else None) or ''
+            if update:
+                self.__get_file_column_queryset().update(**{self.file_field_name: path})
+                setattr(self.instance, self.file_field_name, path)
+            self._field.set_cached_value(self.instance, rel_obj)
+
+        def __invalidate_cache(self, using=None):
+            using = using or router.db_for_write(self.model, instance=self.instance)
+            invalidate_cached_instances(self._field, [self.instance], using)
+
+        async def aadd(self, *objs, **kwargs):
+            return await sync_to_async(self.add)(*objs, **kwargs)
+        aadd.alters_data = True
+
+        def __clear(self, queryset, bulk):
             db = router.db_for_write(self.model, instance=self.instance)
-            for obj in objs:
-                obj.delete(using=db)
-            try:
-                related_obj = self.__get_related_obj()
-            except ObjectDoesNotExist:
-                pass
-            else:
-                setattr(related_obj, self.file_field_name, None)
+            queryset = queryset.using(db)
+            with transaction.atomic(using=db, savepoint=False):
+                if bulk:
+                    queryset.delete()
+                else:
+                    for obj in queryset:
+                        obj.delete(using=db)
+                self.__update_file_column(None)
+            self.__invalidate_cache(db)
+
+        def remove(self, *objs, **kwargs):
+            """
+            Delete ``objs`` and clear the file column of the instance.
+
+            With ``bulk=True`` (the default), the objects are deleted with a
+            single queryset delete(), so their delete() methods are not
+            called.
+            """
+            bulk = kwargs.pop('bulk', True)
+            self.__clear(self.filter(pk__in=[obj.pk for obj in objs]), bulk)
         remove.alters_data = True
 
-        def clear(self):
-            db = router.db_for_write(self.model, instance=self.instance)
-            for obj in self.all():
-                obj.delete(using=db)
-            related_obj = self.__get_related_obj()
-            setattr(related_obj, self.file_field_name, None)
+        async def aremove(self, *objs, **kwargs):
+            return await sync_to_async(self.remove)(*objs, **kwargs)
+        aremove.alters_data = True
+
+        def clear(self, **kwargs):
+            """
+            Delete all of the related objects of the instance and clear its
+            file column, with a single queryset delete() if ``bulk=True``
+            (the default).
+            """
+            bulk = kwargs.pop('bulk', True)
+            self.__clear(self.get_queryset(), bulk)
         clear.alters_data = True
 
+        async def aclear(self, **kwargs):
+            return await sync_to_async(self.clear)(**kwargs)
+        aclear.alters_data = True
+
         def create(self, **kwargs):
             kwargs[self.content_type_field_name] = self.content_type
             kwargs[self.object_id_field_name] = self.pk_val
             db = router.db_for_write(self.model, instance=self.instance)
             super_ = super(GenericRelatedObjectManager, self).using(db)
             new_obj = super_.create(**kwargs)
-            if new_obj.path:
-                related_obj = self.__get_related_obj()
-                setattr(related_obj, self.file_field_name, new_obj.path)
+            self.__invalidate_cache(db)
+            self.__update_file_column(new_obj, update=bool(new_obj.path))
             return new_obj
         create.alters_data = True
 
+        async def acreate(self, **kwargs):
+            return await sync_to_async(self.create)(**kwargs)
+        acreate.alters_data = True
+
+    _generic_related_managers[superclass] = GenericRelatedObjectManager
     return GenericRelatedObjectManager
@@ -17,6 +17,8 @@ try:
 except ImportError:
     get_default_renderer = None
 
+from generic_plus.contenttypes import content_types
+
 from .widgets import generic_fk_file_widget_factory, GenericForeignFileWidget
 
 
@@ -257,19 +259,17 @@ class BaseGenericFileInlineFormSet(BaseGenericInlineFormSet):
         Identical to the parent method, except `get_for_model` is passed
         `for_concrete_model=self.for_concrete_model`.
         """
-        from django.contrib.contenttypes.models import ContentType
-        content_type = ContentType.objects.get_for_model(self.instance,
-            for_concrete_model=self.for_concrete_model)
-        setattr(form.instance, self.ct_field.get_attname(), content_type.pk)
+        content_type_id = content_types.get_id(self.instance,
+            for_concrete_model=self.for_concrete_model, using=self.instance._state.db)
+        setattr(form.instance, self.ct_field.get_attname(), content_type_id)
         setattr(form.instance, self.ct_fk_field.get_attname(),
             self.instance.pk)
         return form.save(commit=commit)
 
     def save_existing(self, form, instance, commit=True):
-        from django.contrib.contenttypes.models import ContentType
-        content_type = ContentType.objects.get_for_model(self.instance,
-            for_concrete_model=self.for_concrete_model)
-        setattr(form.instance, self.ct_field.get_attname(), content_type.pk)
+        content_type_id = content_types.get_id(self.instance,
+            for_concrete_model=self.for_concrete_model, using=self.instance._state.db)
+        setattr(form.instance, self.ct_field.get_attname(), content_type_id)
         setattr(form.instance, self.ct_fk_field.get_attname(), self.instance.pk)
         return form.save(commit=commit)
 
@@ -298,8 +298,6 @@ class BaseGenericFileInlineFormSet(BaseGenericInlineFormSet):
         Identical to parent class, except ``self.initial_forms`` is replaced
         with ``initial_forms``, passed as parameter.
         """
-        from django.contrib.contenttypes.models import ContentType
-
         if not initial_forms:
             return []
 
@@ -354,7 +352,8 @@ class BaseGenericFileInlineFormSet(BaseGenericInlineFormSet):
                 continue
 
             # fk_val: The value one should find in the form's foreign key field
-            old_ct_val = ct_val = ContentType.objects.get_for_model(self.instance.__class__).pk
+            old_ct_val = ct_val = content_types.get_id(
+                self.instance, using=self.instance._state.db)
             old_fk_val = fk_val = self.instance.pk
             if form.instance.pk:
                 original_instance = self.model.objects.get(pk=form.instance.pk)
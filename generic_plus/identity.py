@@ -0,0 +1,96 @@
+"""
+An identity map for the generic related objects of GenericForeignFileFields.
+
+The same parent row often turns up many times while building a page, as
+separate instances (from the cache, search results, several querysets), and
+loading the field for each of them creates a separate related object for
+the same related row. While a GenericFileIdentityMap is active, related
+objects loaded into the field cache of an instance (by the descriptor,
+prefetches, select_generic_file() or a GenericFileLoader) are replaced by
+the first object loaded for the same row, so all instances share it.
+Related objects assigned to the field are stored as they are:
+
+    with GenericFileIdentityMap():
+        ...
+
+GenericFileIdentityMapMiddleware activates an identity map for each request.
+"""
+try:
+    from asgiref.local import Local
+except ImportError:
+    from threading import local as Local
+
+
+__all__ = (
+    'GenericFileIdentityMap', 'GenericFileIdentityMapMiddleware',
+    'get_current_identity_map')
+
+
+_state = Local()
+
+
+def get_current_identity_map():
+    """Return the innermost active GenericFileIdentityMap, or None."""
+    identity_maps = getattr(_state, 'identity_maps', None)
+    return identity_maps[-1] if identity_maps else None
+
+
+class GenericFileIdentityMap(object):
+
+    def __init__(self):
+        # (concrete model, database alias, pk, deferred fields) => object
+        self._objects = {}
+
+    def __enter__(self):
+        identity_maps = getattr(_state, 'identity_maps', None)
+        if identity_maps is None:
+            identity_maps = _state.identity_maps = []
+        identity_maps.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _state.identity_maps.remove(self)
+
+    def __len__(self):
+        return len(self._objects)
+
+    def get(self, obj):
+        """
+        Return the object in the map for the row of ``obj``, adding ``obj``
+        if there isn't one yet. Objects loaded with different deferred
+        fields (see ``related_only``) are kept apart.
+
+        The related objects and prefetches cached on ``obj`` are copied to
+        the object in the map, replacing those it had.
+        """
+        if obj is None or obj._get_pk_val() is None:
+            return obj
+        key = (
+            obj._meta.concrete_model,
+            obj._state.db,
+            obj._get_pk_val(),
+            frozenset(obj.get_deferred_fields()),
+        )
+        existing = self._objects.setdefault(key, obj)
+        if existing is not obj:
+            prefetched = obj.__dict__.get('_prefetched_objects_cache')
+            if prefetched:
+                existing.__dict__.setdefault('_prefetched_objects_cache', {}).update(prefetched)
+            fields_cache = getattr(obj._state, 'fields_cache', None)
+            if fields_cache:
+                existing._state.fields_cache.update(fields_cache)
+        return existing
+
+    def clear(self):
+        self._objects.clear()
+
+
+class GenericFileIdentityMapMiddleware(object):
+    """Activates a GenericFileIdentityMap for each request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with GenericFileIdentityMap():
+            return self.get_response(request)
@@ -0,0 +1,136 @@
+"""
+Batched loading of the generic related objects of GenericForeignFileFields
+for instances that were not loaded by the same queryset (from the cache,
+search results, hand-assembled lists, and so on), which prefetch_related()
+can't help with.
+
+While a GenericFileLoader is active, reading a GenericForeignFileField of an
+instance that doesn't have its related object cached doesn't query. It
+returns the FieldFile for the file path stored on the instance, and
+registers the instance with the loader. When the related object of any of
+the registered instances is needed (FieldFile.related_object), the loader
+flushes: it loads the related objects of all of them, with one query per
+related model, and stores them in their field caches.
+
+    with GenericFileLoader():
+        return render(request, 'page.html', {'items': items})
+
+GenericFileLoaderMiddleware activates a loader for each request.
+"""
+from generic_plus.cache import cache_related_objects, fill_from_cache
+from generic_plus.compat import compat_rel_to
+
+try:
+    from asgiref.local import Local
+except ImportError:
+    from threading import local as Local
+
+
+__all__ = ('GenericFileLoader', 'GenericFileLoaderMiddleware', 'get_current_loader')
+
+
+_state = Local()
+
+
+def get_current_loader():
+    """Return the innermost active GenericFileLoader, or None."""
+    loaders = getattr(_state, 'loaders', None)
+    return loaders[-1] if loaders else None
+
+
+class GenericFileLoader(object):
+
+    def __init__(self):
+        # (field, database alias) => {id(instance): instance}
+        self._pending = {}
+
+    def __enter__(self):
+        loaders = getattr(_state, 'loaders', None)
+        if loaders is None:
+            loaders = _state.loaders = []
+        loaders.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _state.loaders.remove(self)
+
+    def _get_field(self, instance, field):
+        if isinstance(field, str):
+            field = getattr(type(instance), field)
+        return field
+
+    def add(self, instance, field):
+        """
+        Register ``instance`` to have the related object of ``field`` (a
+        GenericForeignFileField or its name) loaded at the next flush.
+        """
+        field = self._get_field(instance, field)
+        if instance._get_pk_val() is None or field.is_cached(instance):
+            return
+        pending = self._pending.setdefault((field, instance._state.db), {})
+        pending[id(instance)] = instance
+
+    def load(self, instance, field):
+        """
+        Return the related object of ``field`` for ``instance``, flushing the
+        loader if it isn't cached yet.
+        """
+        field = self._get_field(instance, field)
+        if not field.is_cached(instance):
+            self.add(instance, field)
+            self.flush()
+        return field.file_descriptor.get_related_object(instance)
+
+    def flush(self):
+        """Load the related objects of all registered instances."""
+        pending, self._pending = self._pending, {}
+        groups = {}
+        for (field, using), instances in pending.items():
+            instances = fill_from_cache(
+                field, [i for i in instances.values() if not field.is_cached(i)])
+            if not instances:
+                continue
+            key = (
+                compat_rel_to(field),
+                field.content_type_field_name,
+                field.object_id_field_name,
+                field.field_identifier_field_name,
+                using,
+            )
+            groups.setdefault(key, []).append((field, instances))
+        for entries in groups.values():
+            self._load_group(entries)
+
+    def _load_group(self, entries):
+        """
+        Load the related objects for ``entries``, a list of (field,
+        instances) whose rows are in the same table of the same database.
+        """
+        field, instances = entries[0]
+        queryset = compat_rel_to(field)._base_manager.all()
+        if len(set(f.get_related_only_fields() for f, _ in entries)) == 1:
+            queryset = field.apply_related_only(queryset)
+        queryset = field.get_related_queryset(instances, queryset)
+        batches, _, pk_fields = field.get_related_batches(
+            entries, field.get_prefetch_chunk_size(queryset.db))
+
+        rel_obj_cache = {}
+        for rel_obj in field.filter_related_queryset(queryset, batches):
+            rel_obj_cache.setdefault(field.get_related_object_key(rel_obj, pk_fields), rel_obj)
+
+        for field, instances in entries:
+            for instance in instances:
+                field.set_loaded_value(
+                    instance, rel_obj_cache.get(field.get_instance_key(instance)))
+            cache_related_objects(field, instances)
+
+
+class GenericFileLoaderMiddleware(object):
+    """Activates a GenericFileLoader for each request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with GenericFileLoader():
+            return self.get_response(request)
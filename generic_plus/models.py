@@ -1,3 +1,4 @@
+import copy
 import types
 
 import monkeybiz
@@ -6,13 +7,27 @@ import monkeybiz
 def patch_django():
     patch_model_form()
     patch_model_admin()
+    patch_queryset()
+    patch_model_pickling()
+    patch_model_refresh()
 
 
 def patch_model_form():
     from django.forms import BaseForm, Field
     from django.forms.boundfield import BoundField
+    from django.forms.models import BaseModelForm
+    from generic_plus.fields import coalesce_file_saves
     from generic_plus.forms import GenericForeignFileFormField, GenericForeignFileBoundField
 
+    @monkeybiz.patch(BaseModelForm)
+    def _save_m2m(old_func, self):
+        """
+        Save the file columns of all GenericForeignFileFields on the form
+        with a single save, after each of their save_form_data() has run
+        """
+        with coalesce_file_saves(self.instance):
+            old_func(self)
+
     if not hasattr(Field, 'get_bound_field'):
         @monkeybiz.patch(BaseForm)
         def __getitem__(old_func, self, name):
@@ -140,4 +155,76 @@ def patch_model_admin(BaseModelAdmin=None, ModelAdmin=None, InlineModelAdmin=Non
         return old_func(self, db_field, **kwargs)
 
 
+def patch_queryset():
+    from django.db.models.query import QuerySet, ModelIterable
+    from generic_plus.fields import QuerysetPeers
+
+    @monkeybiz.patch(QuerySet)
+    def _fetch_all(old_func, self):
+        """
+        Record which instances were loaded together, for models with
+        GenericForeignFileFields that have ``auto_prefetch=True``
+        """
+        is_fetched = self._result_cache is not None
+        old_func(self)
+        if is_fetched or self._iterable_class is not ModelIterable:
+            return
+        if not getattr(self.model, '_generic_plus_auto_prefetch', False):
+            return
+        if len(self._result_cache) < 2:
+            return
+        peers = QuerysetPeers(self._result_cache)
+        for instance in self._result_cache:
+            instance._generic_plus_peers = peers
+
+
+def patch_model_pickling():
+    from django.db.models import Model
+    from generic_plus.fields import GenericForeignFileField, CompactRelatedObject
+
+    @monkeybiz.patch(Model)
+    def __getstate__(old_func, self):
+        """
+        Pickle the generic related objects of GenericForeignFileFields in the
+        field cache as CompactRelatedObjects
+        """
+        state = old_func(self)
+        fields = [
+            f for f in self._meta.private_fields
+            if isinstance(f, GenericForeignFileField)]
+        fields_cache = getattr(state.get('_state'), 'fields_cache', None)
+        if not fields or not fields_cache:
+            return state
+        compact = {}
+        for field in fields:
+            rel_obj = fields_cache.get(field.get_cache_name())
+            if isinstance(rel_obj, Model):
+                compact[field.get_cache_name()] = CompactRelatedObject.from_object(rel_obj)
+        if compact:
+            if state is self.__dict__:
+                state = state.copy()
+            state['_state'] = copy.copy(state['_state'])
+            state['_state'].fields_cache = dict(fields_cache, **compact)
+        return state
+
+
+def patch_model_refresh():
+    from django.db.models import Model
+    from generic_plus.fields import GenericForeignFileField
+
+    @monkeybiz.patch(Model)
+    def refresh_from_db(old_func, self, using=None, fields=None, *args, **kwargs):
+        """
+        Clear the field caches of GenericForeignFileFields, which are private
+        fields, and older versions of Django only clear the caches of
+        concrete fields and related objects
+        """
+        old_func(self, using, fields, *args, **kwargs)
+        for field in self._meta.private_fields:
+            if not isinstance(field, GenericForeignFileField):
+                continue
+            if (fields is None or field.name in fields) and field.is_cached(self):
+                field.delete_cached_value(self)
+
+
 patch_django()
@@ -0,0 +1,244 @@
+"""
+Helpers for loading the generic related objects of GenericForeignFileFields
+for many instances at once.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+from generic_plus.cache import (
+    acache_related_objects, afill_from_cache, cache_related_objects, fill_from_cache)
+from generic_plus.compat import compat_rel_to
+from generic_plus.contenttypes import content_types
+
+
+__all__ = ('prefetch_generic_files', 'aprefetch_generic_files', 'prefetch_file_urls')
+
+
+# Internal types of integer fields, whose columns can be compared with each
+# other whatever their sizes
+INTEGER_FIELD_TYPES = frozenset([
+    'AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField',
+    'BigIntegerField', 'SmallIntegerField', 'PositiveIntegerField',
+    'PositiveBigIntegerField', 'PositiveSmallIntegerField',
+])
+
+# Internal types of fields stored as strings
+TEXT_FIELD_TYPES = frozenset(['CharField', 'SlugField', 'TextField'])
+
+
+def prefetch_generic_files(instances, *field_names, parent_queryset=None, max_workers=None):
+    """
+    Fill the field caches of the GenericForeignFileFields named
+    ``field_names`` on each of ``instances``.
+
+    Fields of a model whose rows live in the same generic related table
+    (see GenericForeignFileField.get_combined_prefetch_key()) are loaded with
+    a single query that matches any of their field identifiers. Instances
+    that already have a field cached are skipped for that field.
+
+    When there are more instances than the field's prefetch chunk size,
+    the object ids are split over several queries or, if the queryset that
+    ``instances`` were loaded from is passed as ``parent_queryset``, matched
+    with a subquery on it instead.
+
+    If ``max_workers`` is greater than one, the queries (one per model and
+    group of fields, or per chunk) are run concurrently on a thread pool of
+    at most that size, each thread using its own database connection. They
+    are run one after another if the current thread is in a transaction,
+    whose uncommitted changes other connections could not see.
+    """
+    prefetches = _get_prefetches(instances, field_names, parent_queryset)
+    querysets = [qs for _, _, _, field_querysets in prefetches for qs in field_querysets]
+    _fill_prefetch_caches(prefetches, evaluate_querysets(querysets, max_workers=max_workers))
+
+
+async def aprefetch_generic_files(instances, *field_names, parent_queryset=None):
+    """
+    Async counterpart of prefetch_generic_files(), using Django's async ORM
+    and the async methods of the cache of fields with a ``cache_alias``.
+    The queries for the different groups of fields and chunks are awaited
+    together.
+    """
+    for model, model_instances in _group_by_model(instances).items():
+        for field_name in field_names:
+            field = getattr(model, field_name)
+            for using in set(i._state.db for i in model_instances):
+                await content_types.aget_for_model(
+                    model, for_concrete_model=field.for_concrete_model, using=using)
+            await afill_from_cache(field, [i for i in model_instances if not field.is_cached(i)])
+    prefetches = _get_prefetches(instances, field_names, parent_queryset, use_cache=False)
+    querysets = [qs for _, _, _, field_querysets in prefetches for qs in field_querysets]
+    results = await asyncio.gather(*[_aevaluate_queryset(qs) for qs in querysets])
+    _fill_prefetch_caches(prefetches, results, use_cache=False)
+    for fields, pending, _, _ in prefetches:
+        for field in fields:
+            await acache_related_objects(field, pending[field])
+
+
+async def _aevaluate_queryset(queryset):
+    return [obj async for obj in queryset]
+
+
+def _group_by_model(instances):
+    instances_by_model = {}
+    for instance in instances:
+        if instance._get_pk_val() is not None:
+            instances_by_model.setdefault(type(instance), []).append(instance)
+    return instances_by_model
+
+
+def _get_prefetches(instances, field_names, parent_queryset=None, use_cache=True):
+    prefetches = []
+    for model, model_instances in _group_by_model(instances).items():
+        field_groups = {}
+        for field_name in field_names:
+            field = getattr(model, field_name)
+            field_groups.setdefault(field.get_combined_prefetch_key(), []).append(field)
+        model_queryset = parent_queryset
+        if model_queryset is not None and model_queryset.model is not model:
+            model_queryset = None
+        for fields in field_groups.values():
+            prefetch = _get_field_group_prefetch(
+                model_instances, fields, model_queryset, use_cache=use_cache)
+            if prefetch is not None:
+                prefetches.append(prefetch)
+    return prefetches
+
+
+def _fill_prefetch_caches(prefetches, results, use_cache=True):
+    results = iter(results)
+    for fields, pending, pk_fields, field_querysets in prefetches:
+        rel_objs = []
+        for _ in field_querysets:
+            rel_objs.extend(next(results))
+        _fill_field_group_caches(fields, pending, pk_fields, rel_objs, use_cache=use_cache)
+
+
+def evaluate_querysets(querysets, max_workers=None):
+    """
+    Return a list with the results of each of ``querysets``, evaluating them
+    concurrently on up to ``max_workers`` threads where that is safe.
+    """
+    if (not max_workers or max_workers < 2 or len(querysets) < 2
+            or any(connections[qs.db].in_atomic_block for qs in querysets)):
+        return [list(qs) for qs in querysets]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(querysets))) as executor:
+        return list(executor.map(_evaluate_queryset_in_thread, querysets))
+
+
+def _evaluate_queryset_in_thread(queryset):
+    # Django connections are thread-local, so the worker thread opens its
+    # own connection, which must be closed before the thread goes away.
+    try:
+        return list(queryset)
+    finally:
+        connections.close_all()
+
+
+def _get_field_group_prefetch(instances, fields, parent_queryset=None, use_cache=True):
+    """
+    Return a tuple of (fields, pending instances by field, primary key
+    fields by content type id, querysets) for a group of fields that can be loaded together, or None if every instance
+    already has them cached. The cache of fields with a ``cache_alias`` is
+    read unless ``use_cache`` is False.
+    """
+    pending = {}
+    for field in fields:
+        field_instances = [i for i in instances if not field.is_cached(i)]
+        if use_cache:
+            field_instances = fill_from_cache(field, field_instances)
+        if field_instances:
+            pending[field] = field_instances
+    if not pending:
+        return None
+
+    fields = [f for f in fields if f in pending]
+    field = fields[0]
+    pending_instances = list(dict(
+        (id(i), i) for field_instances in pending.values() for i in field_instances
+    ).values())
+
+    queryset = compat_rel_to(field)._base_manager.all()
+    if len(set(f.get_related_only_fields() for f in fields)) == 1:
+        queryset = field.apply_related_only(queryset)
+    queryset = field.get_related_queryset(pending_instances, queryset)
+
+    field_identifiers = [f.field_identifier for f in fields]
+    chunk_size = field.get_prefetch_chunk_size(queryset.db)
+    batches, content_type_ids, pk_fields = field.get_related_batches(
+        [(field, pending_instances)], chunk_size, field_identifiers=field_identifiers)
+    if (chunk_size and len(pending_instances) > chunk_size
+            and parent_queryset is not None
+            and parent_queryset.query.can_filter()
+            and parent_queryset.db == queryset.db
+            and _can_match_pks_in_db(field, parent_queryset.model)):
+        batches = [[field.get_related_filter(
+            pending_instances, field_identifiers=field_identifiers,
+            content_type_id=content_type_ids[type(pending_instances[0])],
+            object_ids=parent_queryset.order_by().values('pk'))]]
+    return (fields, pending, pk_fields, field.get_batch_querysets(queryset, batches))
+
+
+def _can_match_pks_in_db(field, model):
+    """
+    Whether the object id column of ``field``'s related model holds values
+    that can be compared with the primary key column of ``model`` in SQL.
+    A text object id can't be compared with a UUID or integer primary key,
+    for instance: the values differ in format (UUIDs are stored without
+    hyphens on some backends), or the comparison is a type error.
+    """
+    object_id_type = compat_rel_to(field)._meta.get_field(
+        field.object_id_field_name).get_internal_type()
+    pk_type = model._meta.pk.get_internal_type()
+    if object_id_type == pk_type:
+        return True
+    return any(
+        object_id_type in types and pk_type in types
+        for types in (INTEGER_FIELD_TYPES, TEXT_FIELD_TYPES))
+
+
+def _fill_field_group_caches(fields, pending, pk_fields, rel_objs, use_cache=True):
+    rel_obj_cache = {}
+    for rel_obj in rel_objs:
+        rel_obj_cache.setdefault(fields[0].get_related_object_key(rel_obj, pk_fields), rel_obj)
+
+    for field in fields:
+        for instance in pending[field]:
+            field.set_loaded_value(
+                instance, rel_obj_cache.get(field.get_instance_key(instance)))
+        if use_cache:
+            cache_related_objects(field, pending[field])
+
+
+def prefetch_file_urls(instances, *field_names):
+    """
+    Generate the URLs of the files of the GenericForeignFileFields named
+    ``field_names`` on each of ``instances``, and memoize them on their
+    FieldFiles (see GenericForeignFileField's ``url_cache_ttl``), so that
+    reading ``url`` afterwards doesn't call the storage.
+
+    No queries are made. Each distinct file name is passed to its storage
+    once; storages with a ``bulk_url(names)`` method, returning the URLs of
+    a list of names (e.g. signing them in one request), are called once.
+    """
+    files_by_storage = {}
+    for instance in instances:
+        for field_name in field_names:
+            field = getattr(type(instance), field_name)
+            file_val = getattr(instance, field.raw_file_field_name)
+            if not file_val or not hasattr(file_val, 'memoize_url'):
+                continue
+            storage_files = files_by_storage.setdefault(id(file_val.storage), (file_val.storage, {}))
+            storage_files[1].setdefault(file_val.name, []).append(file_val)
+
+    for storage, files_by_name in files_by_storage.values():
+        names = list(files_by_name)
+        if hasattr(storage, 'bulk_url'):
+            urls = storage.bulk_url(names)
+        else:
+            urls = [storage.url(name) for name in names]
+        for name, url in zip(names, urls):
+            for file_val in files_by_name[name]:
+                file_val.memoize_url(url)
@@ -0,0 +1,244 @@
+"""
+QuerySet and Manager classes that add GenericForeignFileField-aware loading
+to the models they are attached to.
+"""
+import datetime
+import decimal
+import json
+
+from django.conf import settings
+from django.db import connections, models
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import ModelIterable, normalize_prefetch_lookups
+from django.utils import timezone
+
+try:
+    from django.db.models.functions import JSONObject
+except ImportError:
+    JSONObject = None
+
+from generic_plus.compat import compat_rel_to
+from generic_plus.contenttypes import content_types
+from generic_plus.prefetch import prefetch_generic_files
+
+
+__all__ = ('GenericPlusQuerySet', 'GenericPlusManager')
+
+
+# Internal types of fields whose values don't round-trip through a JSON
+# object, which select_generic_file() then selects column by column
+NON_JSON_FIELD_TYPES = frozenset(['BinaryField', 'JSONField'])
+
+
+class RelatedRowDecoder(json.JSONDecoder):
+    """Decodes JSON numbers with a fraction as Decimals, without rounding."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs['parse_float'] = decimal.Decimal
+        super(RelatedRowDecoder, self).__init__(*args, **kwargs)
+
+
+def from_json_value(rel_field, value, connection):
+    """
+    Convert ``value``, the value of ``rel_field`` in a JSON object built by
+    the database, to the value loading its column would have given.
+    """
+    if value is None:
+        return None
+    value = rel_field.to_python(value)
+    if (isinstance(value, datetime.datetime) and settings.USE_TZ
+            and timezone.is_naive(value)):
+        value = timezone.make_aware(value, connection.timezone)
+    return value
+
+
+class GenericFileModelIterable(ModelIterable):
+    """
+    Yields model instances, building the generic related objects selected
+    with GenericPlusQuerySet.select_generic_file() from their annotations.
+    """
+
+    def __iter__(self):
+        queryset = self.queryset
+        db = queryset.db
+        connection = connections[db]
+        selects = queryset._generic_file_selects
+        for obj in super(GenericFileModelIterable, self).__iter__():
+            for field, rel_fields, aliases, pk_index, as_json in selects:
+                rel_model = compat_rel_to(field)
+                attnames = [f.attname for f in rel_fields]
+                if as_json:
+                    row = obj.__dict__.pop(aliases[0], None)
+                    if row is None:
+                        values = None
+                    else:
+                        values = [
+                            from_json_value(f, row.get(f.attname), connection)
+                            for f in rel_fields]
+                else:
+                    values = [obj.__dict__.pop(alias, None) for alias in aliases]
+                if values is None or values[pk_index] is None:
+                    rel_obj = None
+                else:
+                    rel_obj = rel_model.from_db(db, attnames, values)
+                field.set_loaded_value(obj, rel_obj)
+            yield obj
+
+
+class GenericPlusQuerySet(models.QuerySet):
+
+    def __init__(self, *args, **kwargs):
+        super(GenericPlusQuerySet, self).__init__(*args, **kwargs)
+        self._generic_file_selects = ()
+        self._generic_file_prefetch_workers = None
+
+    def _clone(self, *args, **kwargs):
+        clone = super(GenericPlusQuerySet, self)._clone(*args, **kwargs)
+        clone._generic_file_selects = self._generic_file_selects
+        clone._generic_file_prefetch_workers = self._generic_file_prefetch_workers
+        return clone
+
+    def _prefetch_related_objects(self):
+        # GenericForeignFileFields are loaded with prefetch_generic_files()
+        # before Django's prefetch_related() runs, which then finds them
+        # already cached. Fields that store their rows in the same table
+        # are loaded together, and large result sets are matched with a
+        # subquery on this queryset.
+        field_names = self._get_generic_file_prefetches()
+        if field_names:
+            prefetch_generic_files(
+                self._result_cache, *field_names, parent_queryset=self,
+                max_workers=self._generic_file_prefetch_workers)
+        super(GenericPlusQuerySet, self)._prefetch_related_objects()
+
+    def _get_generic_file_prefetches(self):
+        """
+        Return the names of the GenericForeignFileFields in this queryset's
+        prefetch_related() lookups that can be loaded with
+        prefetch_generic_files(): lookups of only the field itself, without
+        a Prefetch queryset or to_attr, and with no lookups through it.
+        """
+        from generic_plus.fields import GenericForeignFileField
+
+        field_names = []
+        excluded = set()
+        for lookup in normalize_prefetch_lookups(self._prefetch_related_lookups):
+            parts = lookup.prefetch_through.split(LOOKUP_SEP)
+            field_name = parts[0]
+            if not isinstance(getattr(self.model, field_name, None), GenericForeignFileField):
+                continue
+            if (len(parts) > 1 or lookup.queryset is not None
+                    or lookup.prefetch_to != lookup.prefetch_through):
+                excluded.add(field_name)
+            elif field_name not in field_names:
+                field_names.append(field_name)
+        return [n for n in field_names if n not in excluded]
+
+    def parallel_prefetch(self, max_workers=4):
+        """
+        Return a new QuerySet whose GenericForeignFileField prefetches run
+        their independent queries (for different related tables, content
+        types or chunks) concurrently on up to ``max_workers`` threads.
+        Pass ``max_workers=None`` to run them one after another again.
+        """
+        clone = self._chain()
+        clone._generic_file_prefetch_workers = max_workers
+        return clone
+
+    def bulk_create_with_files(self, objs, field_name, files, batch_size=None):
+        """
+        Insert ``objs`` and the generic related rows of their
+        GenericForeignFileField ``field_name``, one for each of ``files``.
+        See GenericForeignFileField.bulk_create_with_files().
+        """
+        from generic_plus.fields import GenericForeignFileField
+
+        field = getattr(self.model, field_name, None)
+        if not isinstance(field, GenericForeignFileField):
+            raise ValueError(
+                "'%s' is not a GenericForeignFileField on %s" % (
+                    field_name, self.model._meta.object_name))
+        return field.bulk_create_with_files(objs, files, using=self._db, batch_size=batch_size)
+
+    def select_generic_file(self, *field_names):
+        """
+        Return a new QuerySet that loads the generic related objects of the
+        given GenericForeignFileFields in the same query as the instances.
+
+        A GenericRelation cannot be joined with ``select_related()``, so the
+        related row is selected with a correlated subquery, filtered on
+        content type, object id and field identifier, that returns its
+        columns as a JSON object. On databases (or Django versions) without
+        JSON objects, or if the related model has binary or JSON columns,
+        each column is selected with its own subquery, which repeats the
+        lookup; use ``related_only`` to limit the columns. The related
+        objects are stored in the field cache of each instance, so that
+        reading the field does not perform a query.
+        """
+        from generic_plus.fields import GenericForeignFileField
+
+        if not field_names:
+            raise TypeError("select_generic_file() requires at least one field name")
+
+        clone = self._chain()
+        selects = list(clone._generic_file_selects)
+        features = connections[self.db].features
+        use_json = bool(
+            JSONObject is not None and getattr(features, 'supports_json_field', False)
+            and getattr(features, 'has_json_object_function', True))
+
+        for field_name in field_names:
+            field = getattr(self.model, field_name, None)
+            if not isinstance(field, GenericForeignFileField):
+                raise ValueError(
+                    "'%s' is not a GenericForeignFileField on %s" % (
+                        field_name, self.model._meta.object_name))
+
+            rel_model = compat_rel_to(field)
+            content_type_id = content_types.get_id(
+                self.model, for_concrete_model=field.for_concrete_model, using=self.db)
+            rel_qs = rel_model._base_manager.filter(**{
+                '%s__pk' % field.content_type_field_name: content_type_id,
+                field.object_id_field_name: models.OuterRef('pk'),
+            })
+            if field.field_identifier_field_name:
+                rel_qs = rel_qs.filter(**{
+                    field.field_identifier_field_name: field.field_identifier,
+                })
+            rel_qs = rel_qs.order_by('pk')
+
+            # A missing related row is detected from its primary key
+            rel_fields = rel_model._meta.concrete_fields
+            only_fields = field.get_related_only_fields()
+            if only_fields is not None:
+                only_fields = set(only_fields)
+                rel_fields = [
+                    f for f in rel_fields
+                    if f.name in only_fields or f.attname in only_fields]
+            pk_index = rel_fields.index(rel_model._meta.pk)
+            alias = '_generic_plus_%s' % field.name
+            if use_json and not any(
+                    f.get_internal_type() in NON_JSON_FIELD_TYPES for f in rel_fields):
+                row = JSONObject(**dict((f.attname, f.attname) for f in rel_fields))
+                clone = clone.annotate(**{alias: models.Subquery(
+                    rel_qs.values_list(row)[:1],
+                    output_field=models.JSONField(decoder=RelatedRowDecoder))})
+                selects.append((field, rel_fields, [alias], pk_index, True))
+                continue
+
+            aliases = []
+            for rel_field in rel_fields:
+                column_alias = '%s_%s' % (alias, rel_field.attname)
+                clone = clone.annotate(**{column_alias: models.Subquery(
+                    rel_qs.values(rel_field.attname)[:1], output_field=rel_field)})
+                aliases.append(column_alias)
+            selects.append((field, rel_fields, aliases, pk_index, False))
+
+        clone._generic_file_selects = tuple(selects)
+        if clone._iterable_class is ModelIterable:
+            clone._iterable_class = GenericFileModelIterable
+        return clone
+
+
+class GenericPlusManager(models.Manager.from_queryset(GenericPlusQuerySet)):
+    pass
@@ -0,0 +1,150 @@
+"""
+Routing of the reads of generic related file objects to read replicas.
+
+The reads that GenericForeignFileFields make (loading the related object of
+an instance, the related manager's querysets, and prefetches) pass the
+``generic_plus_read`` hint to ``router.db_for_read()``. With
+GenericFileReplicaRouter installed, those reads go to one of the replicas
+configured for the database of the instance:
+
+    DATABASE_ROUTERS = ['generic_plus.routers.GenericFileReplicaRouter']
+
+    GENERIC_PLUS_READ_REPLICAS = {
+        'default': ['replica1', 'replica2'],
+    }
+
+(a list or tuple is taken as the replicas of the default database).
+
+Reads stick to the primary database while it is in a transaction, and once
+the current thread has written to a model with a GenericForeignFileField, or
+to the related model of one, until clear_pinned() is called. Add
+PrimaryPinningMiddleware to MIDDLEWARE to scope this to each request, so that
+an editor who has just saved a file sees it on the next read.
+"""
+import random
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+try:
+    from asgiref.local import Local
+except ImportError:
+    from threading import local as Local
+
+
+__all__ = (
+    'READ_HINT', 'GenericFileReplicaRouter', 'PrimaryPinningMiddleware',
+    'pin_primary', 'clear_pinned', 'is_pinned')
+
+
+READ_HINT = 'generic_plus_read'
+
+_state = Local()
+
+_generic_file_models = None
+
+
+def pin_primary(using=DEFAULT_DB_ALIAS):
+    """Send the generic file reads of the current thread to ``using``."""
+    pinned = getattr(_state, 'pinned', None)
+    if pinned is None:
+        pinned = _state.pinned = set()
+    pinned.add(using)
+
+
+def clear_pinned():
+    _state.pinned = set()
+
+
+def is_pinned(using=DEFAULT_DB_ALIAS):
+    return using in (getattr(_state, 'pinned', None) or ())
+
+
+def _get_replica_settings():
+    replicas = getattr(settings, 'GENERIC_PLUS_READ_REPLICAS', None) or {}
+    if isinstance(replicas, (list, tuple)):
+        replicas = {DEFAULT_DB_ALIAS: replicas}
+    return replicas
+
+
+def get_replicas(using=DEFAULT_DB_ALIAS):
+    return list(_get_replica_settings().get(using, ()))
+
+
+def get_primary(using):
+    """Return the primary database of ``using``, if it is a replica."""
+    for primary, aliases in _get_replica_settings().items():
+        if using in aliases:
+            return primary
+    return None
+
+
+def is_generic_file_model(model):
+    """
+    Whether ``model`` has a GenericForeignFileField, or is the related model
+    of one.
+    """
+    global _generic_file_models
+
+    if _generic_file_models is None:
+        from generic_plus.fields import GenericForeignFileField
+        from generic_plus.compat import compat_rel_to
+
+        models = set()
+        for installed_model in apps.get_models():
+            for field in installed_model._meta.private_fields:
+                if isinstance(field, GenericForeignFileField):
+                    models.add(installed_model)
+                    models.add(compat_rel_to(field))
+        _generic_file_models = models
+    return model in _generic_file_models or model._meta.concrete_model in _generic_file_models
+
+
+def _get_instance_db(hints):
+    instance = hints.get('instance')
+    if instance is not None and instance._state.db:
+        return instance._state.db
+    return DEFAULT_DB_ALIAS
+
+
+class GenericFileReplicaRouter(object):
+    """
+    Routes generic file reads to replicas, and writes of generic file models
+    (including of objects that were read from a replica) to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not hints.get(READ_HINT):
+            return None
+        primary = _get_instance_db(hints)
+        primary = get_primary(primary) or primary
+        replicas = get_replicas(primary)
+        if not replicas or is_pinned(primary) or connections[primary].in_atomic_block:
+            return primary
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if not is_generic_file_model(model):
+            return None
+        using = _get_instance_db(hints)
+        primary = get_primary(using)
+        pin_primary(primary or using)
+        return primary
+
+
+class PrimaryPinningMiddleware(object):
+    """
+    Clears the pinning of generic file reads to the primary database at the
+    start and end of each request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        clear_pinned()
+        try:
+            return self.get_response(request)
+        finally:
+            clear_pinned()
@@ -0,0 +1,173 @@
+"""
+Syncing of the file columns of parent models from their generic related
+rows, for GenericForeignFileFields created with ``sync_file_column=True``.
+
+When a related object is saved, the path of its file is copied to the file
+column of the instance it points to (and the column is cleared when the
+related object is deleted). The parent field is looked up in a map of
+(content type, field identifier) => fields, built as the models are
+prepared, so saves don't walk the fields of the parent model.
+
+The UPDATEs are queued per database and run when the transaction commits,
+one per parent model and set of columns, however often the related objects
+were saved in the meantime. Updates queued in a savepoint are registered
+separately, so that they are dropped if it rolls back. Outside of a
+transaction they run right away.
+"""
+from django.db import connections, models, transaction
+from django.db.models.signals import post_delete, post_save
+
+from generic_plus.contenttypes import content_types
+
+try:
+    from asgiref.local import Local
+except ImportError:
+    from threading import local as Local
+
+
+__all__ = ('PendingFileColumnUpdates', 'register_synced_field', 'sync_file_column')
+
+
+# Related model => {
+#     (content type field name, object id field name, field identifier field name):
+#         {(app_label, model_name, field_identifier): [GenericForeignFileField]}}
+_synced_fields = {}
+
+_state = Local()
+
+
+def _get_parent_key(field):
+    opts = field.model._meta
+    if field.for_concrete_model:
+        opts = opts.concrete_model._meta
+    field_identifier = field.field_identifier if field.field_identifier_field_name else None
+    return (opts.app_label, opts.model_name, field_identifier)
+
+
+def register_synced_field(field, rel_model):
+    """
+    Add ``field``, a GenericForeignFileField with ``sync_file_column=True``,
+    to the map of synced fields of ``rel_model``, its related model, and
+    connect sync_file_column() to the saves and deletes of ``rel_model``.
+    """
+    rel_key = (
+        field.content_type_field_name,
+        field.object_id_field_name,
+        field.field_identifier_field_name,
+    )
+    parent_fields = _synced_fields.setdefault(rel_model, {}).setdefault(rel_key, {})
+    fields = parent_fields.setdefault(_get_parent_key(field), [])
+    if field not in fields:
+        fields.append(field)
+    dispatch_uid = 'generic_plus.sync.%s' % rel_model._meta.label_lower
+    post_save.connect(sync_file_column, sender=rel_model, dispatch_uid=dispatch_uid)
+    post_delete.connect(sync_file_column, sender=rel_model, dispatch_uid=dispatch_uid)
+
+
+class PendingFileColumnUpdates(object):
+    """
+    The file column values queued for the parents of database ``using`` in
+    the current transaction. Called on commit to write them.
+    """
+
+    def __init__(self, using, savepoint_ids=()):
+        self.using = using
+        # The savepoints open when the callback was registered, which
+        # on_commit() drops it along with if one of them rolls back
+        self.savepoint_ids = tuple(savepoint_ids)
+        # (model, pk) => {column: path}
+        self.rows = {}
+        self.done = False
+
+    def add(self, model, pk, column, path):
+        self.rows.setdefault((model, pk), {})[column] = path
+
+    def __call__(self):
+        updates = {}
+        for (model, pk), values in self.rows.items():
+            key = (model, tuple(sorted(values)))
+            updates.setdefault(key, []).append((pk, values))
+        self.rows = {}
+        self.done = True
+
+        for (model, columns), rows in updates.items():
+            queryset = model._base_manager.using(self.using)
+            if len(rows) == 1:
+                pk, values = rows[0]
+                queryset.filter(pk=pk).update(**values)
+                continue
+            # bulk_update() would read the columns through the descriptors of
+            # GenericForeignFileFields, which load the related objects
+            queryset.filter(pk__in=[pk for pk, _ in rows]).update(**dict(
+                (column, models.Case(*[
+                    models.When(pk=pk, then=models.Value(values[column]))
+                    for pk, values in rows
+                ], output_field=models.CharField()))
+                for column in columns))
+
+
+def get_pending_updates(using):
+    """
+    Return the PendingFileColumnUpdates registered last in the current
+    savepoint of ``using``, or a new one, which the caller registers with
+    on_commit().
+
+    Updates queued in a savepoint go to a callback registered in it, so that
+    they are dropped if it rolls back. Only the last callback is added to,
+    so that the callbacks write the updates in the order they were queued.
+    """
+    pending_by_db = getattr(_state, 'pending', None)
+    if pending_by_db is None:
+        pending_by_db = _state.pending = {}
+    pending = pending_by_db.get(using)
+    connection = connections[using]
+    savepoint_ids = tuple(connection.savepoint_ids)
+    # The callback is dropped from run_on_commit when it has run, or when
+    # the (savepoint of the) transaction it was registered in rolls back.
+    if (pending is not None and not pending.done and connection.in_atomic_block
+            and pending.savepoint_ids == savepoint_ids
+            and any(entry[1] is pending for entry in connection.run_on_commit)):
+        return pending
+    pending = pending_by_db[using] = PendingFileColumnUpdates(using, savepoint_ids)
+    return pending
+
+
+def sync_file_column(sender, instance, using, **kwargs):
+    """post_save and post_delete receiver for related models."""
+    deleted = kwargs.get('signal') is post_delete
+    queued = []
+    for rel_key, parent_fields in _synced_fields.get(sender, {}).items():
+        content_type_field_name, object_id_field_name, field_identifier_field_name = rel_key
+        natural_key = content_types.get_natural_key(
+            getattr(instance, '%s_id' % content_type_field_name), using)
+        if natural_key is None:
+            continue
+        field_identifier = None
+        if field_identifier_field_name:
+            field_identifier = getattr(instance, field_identifier_field_name)
+        fields = parent_fields.get(natural_key + (field_identifier,))
+        if not fields:
+            continue
+        object_id = getattr(instance, object_id_field_name)
+        if object_id is None:
+            continue
+        for field in fields:
+            path = ''
+            if not deleted:
+                path = getattr(instance, field.rel_file_field_name).name or ''
+            queued.append((
+                field.model,
+                field.to_pk_value(field.model._meta.pk, object_id),
+                field.file_field.attname,
+                path,
+            ))
+
+    if not queued:
+        return
+    pending = get_pending_updates(using)
+    # A PendingFileColumnUpdates with queued rows is already registered
+    register = not pending.rows
+    for model, pk, column, path in queued:
+        pending.add(model, pk, column, path)
+    if register:
+        transaction.on_commit(pending, using=using)
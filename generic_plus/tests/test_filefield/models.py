@@ -1,7 +1,11 @@
+import uuid
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 
+from generic_plus.query import GenericPlusManager
+
 from .fields import TestField
 
 
@@ -38,6 +42,10 @@ class TestFileModel(models.Model):
     class Meta:
         app_label = "generic_plus"
 
+    @property
+    def path(self):
+        return self.file.name if self.file else None
+
     def save(self, **kwargs):
         super(TestFileModel, self).save(**kwargs)
         model_class = self.content_type.model_class()
@@ -62,6 +70,8 @@ class TestGenericPlusModel(models.Model):
     slug = models.SlugField()
     test_file = TestField(upload_to="test")
 
+    objects = GenericPlusManager()
+
     class Meta:
         app_label = "generic_plus"
 
@@ -75,6 +85,121 @@ class SecondTestGenericPlusModel(models.Model):
         app_label = "generic_plus"
 
 
+class AutoPrefetchTestModel(models.Model):
+
+    slug = models.SlugField()
+    test_file = TestField(upload_to="test", auto_prefetch=True)
+
+    class Meta:
+        app_label = "generic_plus"
+
+
+class LazyTestModel(models.Model):
+
+    slug = models.SlugField()
+    test_file = TestField(upload_to="test", lazy_related_object=True)
+
+    class Meta:
+        app_label = "generic_plus"
+
+
+class RelatedOnlyTestModel(models.Model):
+
+    slug = models.SlugField()
+    test_file = TestField(upload_to="test", related_only=('related',))
+
+    objects = GenericPlusManager()
+
+    class Meta:
+        app_label = "generic_plus"
+
+
+class MultipleFileTestModel(models.Model):
+
+    slug = models.SlugField()
+    file_a = TestField(upload_to="test", field_identifier="a")
+    file_b = TestField(upload_to="test", field_identifier="b")
+    file_c = TestField(upload_to="test", field_identifier="c")
+
+    objects = GenericPlusManager()
+
+    class Meta:
+        app_label = "generic_plus"
+
+
+class CachedTestModel(models.Model):
+
+    slug = models.SlugField()
+    test_file = TestField(upload_to="test", cache_alias="default")
+
+    objects = GenericPlusManager()
+
+    class Meta:
+        app_label = "generic_plus"
+
+
+class SyncedTestModel(models.Model):
+
+    slug = models.SlugField()
+    file_a = TestField(upload_to="test", field_identifier="a", sync_file_column=True)
+    file_b = TestField(upload_to="test", field_identifier="b", sync_file_column=True)
+
+    class Meta:
+        app_label = "generic_plus"
+
+
+class CharObjectIdFileModel(models.Model):
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=255)
+    content_object = GenericForeignKey('content_type', 'object_id')
+    field_identifier = models.SlugField(null=False, blank=True, default="")
+
+    file = models.FileField(upload_to="test")
+
+    class Meta:
+        app_label = "generic_plus"
+
+    @property
+    def path(self):
+        return self.file.name if self.file else None
+
+
+class UUIDPkTestModel(models.Model):
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    slug = models.SlugField()
+    test_file = TestField("generic_plus.CharObjectIdFileModel", upload_to="test")
+
+    objects = GenericPlusManager()
+
+    class Meta:
+        app_label = "generic_plus"
+
+
+class CharPkTestModel(models.Model):
+
+    slug = models.SlugField(primary_key=True)
+    test_file = TestField("generic_plus.CharObjectIdFileModel", upload_to="test")
+
+    objects = GenericPlusManager()
+
+    class Meta:
+        app_label = "generic_plus"
+
+
+class BigIntPkTestModel(models.Model):
+
+    id = models.BigAutoField(primary_key=True)
+    slug = models.SlugField()
+    test_file = TestField("generic_plus.CharObjectIdFileModel", upload_to="test")
+
+    objects = GenericPlusManager()
+
+    class Meta:
+        app_label = "generic_plus"
+
+
 class OtherGenericRelatedModel(models.Model):
 
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
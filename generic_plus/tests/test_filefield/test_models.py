@@ -1,12 +1,40 @@
+import copy
 import os
+import pickle
 import shutil
+import threading
+import time
+import unittest
+from unittest import mock
 
+import django
 from django import test
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connection, transaction
+from django.forms.models import modelform_factory
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Prefetch, prefetch_related_objects
 
+from generic_plus.cache import get_cache_key
+from generic_plus.compat import can_return_bulk_insert_pks
+from generic_plus import prefetch
+from generic_plus.contenttypes import content_types
+from generic_plus.fields import CompactRelatedObject
+from generic_plus.identity import GenericFileIdentityMap
+from generic_plus.loader import GenericFileLoader
+from generic_plus.prefetch import aprefetch_generic_files, prefetch_file_urls
+from generic_plus.routers import GenericFileReplicaRouter, READ_HINT, clear_pinned
+
+from .fields import TestField
 from .models import (TestGenericPlusModel, TestM2M, TestFileModel,
-    SecondTestGenericPlusModel, OtherGenericRelatedModel)
+    SecondTestGenericPlusModel, OtherGenericRelatedModel, AutoPrefetchTestModel,
+    LazyTestModel, RelatedOnlyTestModel, MultipleFileTestModel, CachedTestModel,
+    CharObjectIdFileModel, UUIDPkTestModel, CharPkTestModel, BigIntPkTestModel,
+    SyncedTestModel)
 
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
@@ -18,6 +46,7 @@ class TestModels(test.TestCase):
     def setUpClass(cls):
         super(TestModels, cls).setUpClass()
         shutil.copytree(DATA_DIR, os.path.join(settings.MEDIA_ROOT, 'test'))
+        content_types.warm()
 
     def test_query(self):
         fm_a = TestFileModel.objects.create(
@@ -34,6 +63,21 @@ class TestModels(test.TestCase):
         self.assertEqual(len(qset), 1)
         self.assertEqual(qset[0], a)
 
+    def test_content_type_table(self):
+        ContentType.objects.clear_cache()
+        with self.assertNumQueries(0):
+            content_type = content_types.get_for_model(TestGenericPlusModel)
+            self.assertEqual(content_types.get_id(
+                TestGenericPlusModel(), for_concrete_model=False), content_type.pk)
+        self.assertEqual(content_type, ContentType.objects.get_for_model(TestGenericPlusModel))
+
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        TestFileModel.objects.create(content_object=obj, file='test/foo.txt')
+        obj = TestGenericPlusModel.objects.get(pk=obj.pk)
+        ContentType.objects.clear_cache()
+        with self.assertNumQueries(1):
+            self.assertEqual(obj.test_file.related_object.object_id, obj.pk)
+
     def test_prefetch_related(self):
         TestFileModel.objects.create(
             content_object=TestGenericPlusModel.objects.create(
@@ -85,3 +129,913 @@ class TestModels(test.TestCase):
             for instance in qset:
                 self.assertNotEqual(instance.content_object.test_file.related_object, None)
                 self.assertEqual(instance.content_object.test_file.related_object.content_object.slug, instance.slug)
+
+    def test_repeated_access_is_memoized(self):
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        fm_a = TestFileModel.objects.create(content_object=obj, file='test/foo.txt')
+        obj = TestGenericPlusModel.objects.get(pk=obj.pk)
+        with self.assertNumQueries(1):
+            file_a = obj.test_file
+        with self.assertNumQueries(0):
+            self.assertIs(obj.test_file, file_a)
+            self.assertIs(obj.test_file, file_a)
+        self.assertEqual(file_a.related_object, fm_a)
+
+    def test_memo_dropped_on_set_and_refresh(self):
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        fm_a = TestFileModel.objects.create(content_object=obj, file='test/foo.txt')
+        obj = TestGenericPlusModel.objects.get(pk=obj.pk)
+        file_a = obj.test_file
+        obj.test_file = "test/bar.txt"
+        self.assertIsNot(obj.test_file, file_a)
+        self.assertEqual(obj.test_file.name, "test/bar.txt")
+        self.assertEqual(obj.test_file.related_object, fm_a)
+
+        fm_b = TestFileModel.objects.create(content_object=obj, file='test/bar.txt')
+        fm_a.delete()
+        obj.refresh_from_db()
+        self.assertEqual(obj.test_file.name, "test/foo.txt")
+        self.assertEqual(obj.test_file.related_object, fm_b)
+
+    def test_auto_prefetch(self):
+        for slug, path in [('gp-a', 'test/foo.txt'), ('gp-b', 'test/bar.txt'), ('gp-c', '')]:
+            obj = AutoPrefetchTestModel.objects.create(slug=slug, test_file=path)
+            if path:
+                TestFileModel.objects.create(content_object=obj, file=path)
+
+        with self.assertNumQueries(2):
+            for item in AutoPrefetchTestModel.objects.all():
+                related_object = item.test_file.related_object
+                if item.slug == 'gp-c':
+                    self.assertIsNone(related_object)
+                else:
+                    self.assertEqual(related_object.file.name, item.test_file.name)
+
+    def test_lazy_related_object(self):
+        obj = LazyTestModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        fm_a = TestFileModel.objects.create(content_object=obj, file='test/foo.txt')
+        obj = LazyTestModel.objects.get(pk=obj.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(obj.test_file.url, "/media/test/foo.txt")
+            self.assertEqual(obj.test_file.name, "test/foo.txt")
+        with self.assertNumQueries(1):
+            self.assertEqual(obj.test_file.related_object, fm_a)
+        with self.assertNumQueries(0):
+            self.assertEqual(obj.test_file.related_object, fm_a)
+
+    def test_generic_file_loader(self):
+        objs = []
+        for model_cls in (TestGenericPlusModel, SecondTestGenericPlusModel):
+            for slug, path in [('gp-a', 'test/foo.txt'), ('gp-b', 'test/bar.txt')]:
+                obj = model_cls.objects.create(slug=slug, test_file=path)
+                TestFileModel.objects.create(content_object=obj, file=path, description=slug)
+                objs.append(model_cls.objects.get(pk=obj.pk))
+        obj = MultipleFileTestModel.objects.create(slug='gp-c')
+        TestFileModel.objects.create(
+            content_object=obj, file='test/foo.txt', field_identifier='a', description='gp-c')
+        objs.append(MultipleFileTestModel.objects.get(pk=obj.pk))
+
+        with GenericFileLoader():
+            with self.assertNumQueries(0):
+                for obj in objs[:-1]:
+                    self.assertTrue(obj.test_file.name)
+                objs[-1].file_a
+                objs[-1].file_b
+            with self.assertNumQueries(1):
+                self.assertEqual(objs[0].test_file.related_object.description, 'gp-a')
+        with self.assertNumQueries(0):
+            for obj in objs[:-1]:
+                self.assertEqual(obj.test_file.related_object.object_id, obj.pk)
+                self.assertEqual(obj.test_file.related_object.description, obj.slug)
+                self.assertEqual(obj.test_file.name, obj.test_file.related_object.file.name)
+            self.assertEqual(objs[-1].file_a.related_object.description, 'gp-c')
+            self.assertIsNone(objs[-1].file_b.related_object)
+
+    def test_generic_file_identity_map(self):
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        TestFileModel.objects.create(content_object=obj, file='test/foo.txt')
+        TestGenericPlusModel.objects.create(slug='gp-b', test_file="")
+
+        with GenericFileIdentityMap() as identity_map:
+            a1 = TestGenericPlusModel.objects.get(pk=obj.pk)
+            a2, b = TestGenericPlusModel.objects.order_by('slug').prefetch_related('test_file')
+            a3 = TestGenericPlusModel.objects.select_generic_file('test_file').get(pk=obj.pk)
+            related_object = a1.test_file.related_object
+            self.assertIs(a2.test_file.related_object, related_object)
+            self.assertIs(a3.test_file.related_object, related_object)
+            self.assertIsNone(b.test_file.related_object)
+            self.assertEqual(len(identity_map), 1)
+
+        a4 = TestGenericPlusModel.objects.get(pk=obj.pk)
+        self.assertIsNot(a4.test_file.related_object, related_object)
+        self.assertEqual(a4.test_file.related_object, related_object)
+
+    def test_identity_map_assignment_and_nested_prefetch(self):
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        fm_a = TestFileModel.objects.create(
+            content_object=obj, file='test/foo.txt', description='A')
+        fm_a.m2m.add(TestM2M.objects.create(slug='m2m-a'))
+
+        with GenericFileIdentityMap():
+            a1 = TestGenericPlusModel.objects.get(pk=obj.pk)
+            related_object = a1.test_file.related_object
+
+            # Objects assigned to the field are kept as they are
+            fm_b = TestFileModel.objects.get(pk=fm_a.pk)
+            fm_b.description = 'B'
+            fm_b.save()
+            a1.test_file = fm_b
+            self.assertIs(a1.test_file.related_object, fm_b)
+            self.assertEqual(a1.test_file.related_object.description, 'B')
+
+            # Nested prefetches land on the object the instance holds
+            a2 = list(TestGenericPlusModel.objects.prefetch_related('test_file__m2m'))[0]
+            self.assertIs(a2.test_file.related_object, related_object)
+            with self.assertNumQueries(0):
+                self.assertEqual(
+                    [m.slug for m in a2.test_file.related_object.m2m.all()], ['m2m-a'])
+
+    @unittest.skipIf(django.VERSION < (3, 2), "captureOnCommitCallbacks() needs Django 3.2+")
+    def test_cache_alias(self):
+        cache = caches['default']
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        obj = CachedTestModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        fm_a = TestFileModel.objects.create(content_object=obj, file='test/foo.txt', description='A')
+        CachedTestModel.objects.create(slug='gp-b', test_file="")
+
+        qset = CachedTestModel.objects.order_by('slug').prefetch_related('test_file')
+        with self.assertNumQueries(2):
+            list(qset.all())
+        with self.assertNumQueries(1):
+            a, b = list(qset.all())
+        with self.assertNumQueries(0):
+            self.assertEqual(a.test_file.related_object, fm_a)
+            self.assertEqual(a.test_file.related_object.description, 'A')
+            self.assertEqual(a.test_file.related_object.file.name, 'test/foo.txt')
+            self.assertIsNone(b.test_file.related_object)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fm_a.description = 'B'
+            fm_a.save()
+        a = CachedTestModel.objects.get(pk=obj.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(a.test_file.related_object.description, 'B')
+        a = CachedTestModel.objects.get(pk=obj.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(a.test_file.related_object.description, 'B')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            a.test_file_generic_rel.remove(fm_a)
+        a = CachedTestModel.objects.get(pk=obj.pk)
+        with self.assertNumQueries(1):
+            self.assertIsNone(a.test_file.related_object)
+
+    def test_cache_alias_prefetch_related_objects(self):
+        cache = caches['default']
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        obj = CachedTestModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        fm_a = TestFileModel.objects.create(content_object=obj, file='test/foo.txt')
+        CachedTestModel.objects.create(slug='gp-b', test_file="")
+
+        a, b = list(CachedTestModel.objects.order_by('slug'))
+        with self.assertNumQueries(1):
+            prefetch_related_objects([a, b], 'test_file')
+        a, b = list(CachedTestModel.objects.order_by('slug'))
+        with self.assertNumQueries(0):
+            prefetch_related_objects([a, b], 'test_file')
+            self.assertEqual(a.test_file.related_object, fm_a)
+            self.assertIsNone(b.test_file.related_object)
+
+        # A Prefetch() queryset is always run
+        a, b = list(CachedTestModel.objects.order_by('slug'))
+        with self.assertNumQueries(1):
+            prefetch_related_objects(
+                [a, b], Prefetch('test_file', queryset=TestFileModel.objects.all()))
+
+    def test_cache_alias_repointed_related_object(self):
+        cache = caches['default']
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        a = CachedTestModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        b = CachedTestModel.objects.create(slug='gp-b', test_file="")
+        fm_a = TestFileModel.objects.create(content_object=a, file='test/foo.txt')
+        self.assertEqual(CachedTestModel.objects.get(pk=a.pk).test_file.related_object, fm_a)
+
+        fm_a = TestFileModel.objects.get(pk=fm_a.pk)
+        fm_a.object_id = b.pk
+        fm_a.save()
+        with self.assertNumQueries(2):
+            self.assertIsNone(CachedTestModel.objects.get(pk=a.pk).test_file.related_object)
+
+    def test_pickle(self):
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        fm_a = TestFileModel.objects.create(content_object=obj, file='test/foo.txt', description='A')
+        obj = TestGenericPlusModel.objects.get(pk=obj.pk)
+        self.assertEqual(obj.test_file.related_object, fm_a)
+
+        data = pickle.dumps(obj)
+        self.assertEqual(obj.test_file.related_object.description, 'A')
+        unpickled = pickle.loads(data)
+        self.assertIsInstance(unpickled._state.fields_cache['test_file'], CompactRelatedObject)
+        with self.assertNumQueries(0):
+            self.assertEqual(unpickled.test_file.name, 'test/foo.txt')
+            self.assertEqual(unpickled.test_file.url, '/media/test/foo.txt')
+            self.assertEqual(unpickled.test_file_raw.name, 'test/foo.txt')
+            related_object = unpickled.test_file.related_object
+            self.assertEqual(related_object, fm_a)
+            self.assertEqual(related_object.description, 'A')
+            self.assertEqual(related_object.file.name, 'test/foo.txt')
+
+    def test_pickle_field_file(self):
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        TestFileModel.objects.create(content_object=obj, file='test/foo.txt')
+        obj = TestGenericPlusModel.objects.get(pk=obj.pk)
+        test_file = obj.test_file
+        copies = [
+            pickle.loads(pickle.dumps(test_file)),
+            copy.copy(test_file),
+            copy.deepcopy(test_file),
+        ]
+        for file_copy in copies:
+            with self.subTest(file_copy=file_copy):
+                self.assertIsInstance(file_copy, type(test_file))
+                self.assertEqual(file_copy.name, 'test/foo.txt')
+                self.assertEqual(file_copy.url, '/media/test/foo.txt')
+                self.assertEqual(file_copy.instance.pk, obj.pk)
+                self.assertEqual(file_copy.field.name, 'test_file')
+                self.assertIsInstance(file_copy.field, type(test_file.field))
+
+    def test_url_memoization(self):
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        TestFileModel.objects.create(content_object=obj, file='test/foo.txt')
+        obj = TestGenericPlusModel.objects.get(pk=obj.pk)
+        storage = obj.test_file.storage
+        field = TestGenericPlusModel.test_file
+        with mock.patch.object(storage, 'url', wraps=storage.url) as storage_url:
+            # Not memoized by default
+            self.assertEqual(obj.test_file.url, '/media/test/foo.txt')
+            self.assertEqual(obj.test_file.url, '/media/test/foo.txt')
+            self.assertEqual(storage_url.call_count, 2)
+
+            field.url_cache_ttl = 60
+            try:
+                obj = TestGenericPlusModel.objects.get(pk=obj.pk)
+                self.assertEqual(obj.test_file.url, '/media/test/foo.txt')
+                self.assertEqual(obj.test_file.url, '/media/test/foo.txt')
+                self.assertEqual(storage_url.call_count, 3)
+                obj.test_file = 'test/bar.txt'
+                self.assertEqual(obj.test_file.url, '/media/test/bar.txt')
+                self.assertEqual(storage_url.call_count, 4)
+                with mock.patch.object(time, 'monotonic', return_value=time.monotonic() + 61):
+                    self.assertEqual(obj.test_file.url, '/media/test/bar.txt')
+                self.assertEqual(storage_url.call_count, 5)
+            finally:
+                field.url_cache_ttl = None
+
+    def test_prefetch_file_urls(self):
+        for slug, path in [('gp-a', 'test/foo.txt'), ('gp-b', 'test/foo.txt'),
+                           ('gp-c', 'test/bar.txt'), ('gp-d', '')]:
+            TestGenericPlusModel.objects.create(slug=slug, test_file=path)
+        objs = list(TestGenericPlusModel.objects.order_by('slug'))
+        storage = objs[0].test_file_raw.storage
+
+        bulk_url = mock.Mock(side_effect=lambda names: ['/signed/%s' % n for n in names])
+        with mock.patch.object(storage, 'bulk_url', bulk_url, create=True):
+            with self.assertNumQueries(0):
+                prefetch_file_urls(objs, 'test_file')
+        bulk_url.assert_called_once_with(['test/foo.txt', 'test/bar.txt'])
+        with mock.patch.object(storage, 'url') as storage_url:
+            self.assertEqual(
+                [o.test_file.url for o in objs[:3]],
+                ['/signed/test/foo.txt', '/signed/test/foo.txt', '/signed/test/bar.txt'])
+        self.assertFalse(storage_url.called)
+
+    def test_prefetch_non_integer_pks(self):
+        objs = [
+            UUIDPkTestModel.objects.create(slug='gp-a', test_file="test/foo.txt"),
+            CharPkTestModel.objects.create(slug='gp-b', test_file="test/foo.txt"),
+            BigIntPkTestModel.objects.create(id=2 ** 40, slug='gp-c', test_file="test/foo.txt"),
+        ]
+        for obj in objs:
+            CharObjectIdFileModel.objects.create(content_object=obj, file='test/foo.txt')
+
+        def assert_prefetched(instances):
+            with self.assertNumQueries(0):
+                for instance in instances:
+                    related_object = instance.test_file.related_object
+                    self.assertIsNotNone(related_object)
+                    self.assertEqual(related_object.object_id, str(instance.pk))
+
+        for model_cls in (UUIDPkTestModel, CharPkTestModel, BigIntPkTestModel):
+            with self.subTest(model=model_cls.__name__):
+                instances = list(model_cls.objects.all())
+                with self.assertNumQueries(1):
+                    prefetch_related_objects(instances, 'test_file')
+                assert_prefetched(instances)
+
+                with self.assertNumQueries(2):
+                    instances = list(model_cls.objects.prefetch_related('test_file'))
+                assert_prefetched(instances)
+
+        instances = [type(obj).objects.get(pk=obj.pk) for obj in objs]
+        with self.assertNumQueries(1):
+            prefetch_related_objects(instances, 'test_file')
+        assert_prefetched(instances)
+
+        instances = [type(obj).objects.get(pk=obj.pk) for obj in objs]
+        with GenericFileLoader():
+            with self.assertNumQueries(1):
+                for instance in instances:
+                    instance.test_file
+                instances[0].test_file.related_object
+            assert_prefetched(instances)
+
+        # With more instances than the chunk size, the object ids are matched
+        # with a subquery on the parent queryset when the object id column
+        # can be compared with the primary key column in the database, and
+        # in chunks otherwise.
+        UUIDPkTestModel.objects.create(slug='gp-d', test_file="test/bar.txt")
+        CharPkTestModel.objects.create(slug='gp-e', test_file="test/bar.txt")
+        BigIntPkTestModel.objects.create(id=2 ** 40 + 1, slug='gp-f', test_file="test/bar.txt")
+        for model_cls in (UUIDPkTestModel, CharPkTestModel, BigIntPkTestModel):
+            for obj in model_cls.objects.filter(slug__in=['gp-d', 'gp-e', 'gp-f']):
+                CharObjectIdFileModel.objects.create(content_object=obj, file='test/bar.txt')
+
+        chunk_size = mock.patch.object(TestField, 'get_prefetch_chunk_size', return_value=1)
+        for model_cls, num_queries in (
+                (UUIDPkTestModel, 3), (CharPkTestModel, 2), (BigIntPkTestModel, 3)):
+            with self.subTest(model=model_cls.__name__, chunked=True), chunk_size:
+                with self.assertNumQueries(num_queries):
+                    instances = list(model_cls.objects.prefetch_related('test_file'))
+                self.assertEqual(len(instances), 2)
+                assert_prefetched(instances)
+
+    @unittest.skipIf(django.VERSION < (4, 1), "The async ORM needs Django 4.1+")
+    async def test_async_access(self):
+        obj = await TestGenericPlusModel.objects.acreate(slug='gp-a', test_file="test/foo.txt")
+        fm_a = await TestFileModel.objects.acreate(content_object=obj, file='test/foo.txt')
+        obj = await TestGenericPlusModel.objects.aget(pk=obj.pk)
+        test_file = await obj.aget_test_file()
+        self.assertEqual(test_file.name, 'test/foo.txt')
+        self.assertEqual(test_file.related_object, fm_a)
+        self.assertIs(obj.test_file, test_file)
+
+        instances = [i async for i in TestGenericPlusModel.objects.all()]
+        await aprefetch_generic_files(instances, 'test_file')
+        self.assertTrue(TestGenericPlusModel.test_file.is_cached(instances[0]))
+        self.assertEqual(instances[0].test_file.related_object, fm_a)
+
+        for slug in ('gp-a', 'gp-b'):
+            await AutoPrefetchTestModel.objects.acreate(slug=slug, test_file="")
+        instances = [i async for i in AutoPrefetchTestModel.objects.all()]
+        await instances[0].aget_test_file()
+        self.assertTrue(AutoPrefetchTestModel.test_file.is_cached(instances[1]))
+
+    @unittest.skipIf(django.VERSION < (4, 1), "The async ORM needs Django 4.1+")
+    async def test_async_prefetch_cache_alias(self):
+        cache = caches['default']
+        await cache.aclear()
+        self.addCleanup(cache.clear)
+        obj = await CachedTestModel.objects.acreate(slug='gp-a', test_file="test/foo.txt")
+        fm_a = await TestFileModel.objects.acreate(content_object=obj, file='test/foo.txt')
+        await CachedTestModel.objects.acreate(slug='gp-b', test_file="")
+
+        # The cache is only called through its async methods
+        sync_calls = mock.Mock(side_effect=AssertionError("Synchronous cache call"))
+        with mock.patch.object(type(cache), 'get_many', sync_calls), \
+                mock.patch.object(type(cache), 'set_many', sync_calls):
+            instances = [i async for i in CachedTestModel.objects.order_by('slug')]
+            await aprefetch_generic_files(instances, 'test_file')
+            self.assertEqual(instances[0].test_file.related_object, fm_a)
+
+            instances = [i async for i in CachedTestModel.objects.order_by('slug')]
+            with mock.patch.object(prefetch, '_aevaluate_queryset') as aevaluate:
+                await aprefetch_generic_files(instances, 'test_file')
+            aevaluate.assert_not_called()
+            self.assertEqual(instances[0].test_file.related_object, fm_a)
+            self.assertIsNone(instances[1].test_file.related_object)
+
+    @unittest.skipIf(django.VERSION < (4, 1), "The async ORM needs Django 4.1+")
+    async def test_async_manager_cache_alias(self):
+        obj = await CachedTestModel.objects.acreate(slug='gp-a', test_file="")
+        fm_a = await obj.test_file_generic_rel.acreate(file='test/foo.txt')
+        self.assertEqual(fm_a.object_id, obj.pk)
+        file_column = CachedTestModel.objects.filter(pk=obj.pk).values_list(
+            'test_file', flat=True)
+        self.assertEqual(await file_column.aget(), 'test/foo.txt')
+
+    def test_manager_bulk(self):
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="")
+        other = TestGenericPlusModel.objects.create(slug='gp-b', test_file="")
+        fm_a = TestFileModel.objects.create(content_object=other, file='test/foo.txt')
+        manager = obj.test_file_generic_rel
+
+        with self.assertNumQueries(2):
+            manager.add(fm_a)
+        self.assertEqual(list(manager.all()), [fm_a])
+        with self.assertNumQueries(0):
+            self.assertEqual(obj.test_file.name, 'test/foo.txt')
+            self.assertIs(obj.test_file.related_object, fm_a)
+        self.assertEqual(TestGenericPlusModel.objects.get(pk=obj.pk).test_file.name, 'test/foo.txt')
+
+        with self.assertNumQueries(4):
+            manager.remove(fm_a)
+        self.assertFalse(manager.exists())
+        with self.assertNumQueries(0):
+            self.assertIsNone(obj.test_file.related_object)
+        self.assertEqual(TestGenericPlusModel.objects.get(pk=obj.pk).test_file.name, '')
+
+        fm_b = TestFileModel(file='test/bar.txt')
+        with self.assertNumQueries(0), self.assertRaisesRegex(ValueError, "isn't saved"):
+            manager.add(fm_b)
+        with self.assertNumQueries(2):
+            manager.add(fm_b, bulk=False)
+        self.assertIsNotNone(fm_b.pk)
+        self.assertIs(obj.test_file.related_object, fm_b)
+        self.assertEqual(list(manager.all()), [fm_b])
+        self.assertEqual(TestGenericPlusModel.objects.get(pk=obj.pk).test_file.name, 'test/bar.txt')
+
+        with self.assertNumQueries(4):
+            manager.clear()
+        self.assertFalse(manager.exists())
+        with self.assertNumQueries(0):
+            self.assertIsNone(obj.test_file.related_object)
+        self.assertEqual(TestGenericPlusModel.objects.get(pk=obj.pk).test_file.name, '')
+
+    def test_manager_field_identifier(self):
+        obj = MultipleFileTestModel.objects.create(slug='mf-a')
+        fm_a = TestFileModel.objects.create(
+            content_object=obj, field_identifier='a', file='test/foo.txt')
+        fm_b = TestFileModel.objects.create(
+            content_object=obj, field_identifier='b', file='test/bar.txt')
+        self.assertEqual(list(obj.file_a_generic_rel.all()), [fm_a])
+
+        obj.file_a_generic_rel.clear()
+        self.assertEqual(list(TestFileModel.objects.filter(object_id=obj.pk)), [fm_b])
+        obj.file_b_generic_rel.remove(fm_a)
+        self.assertEqual(list(TestFileModel.objects.filter(object_id=obj.pk)), [fm_b])
+
+        obj.file_c_generic_rel = None
+        self.assertEqual(list(TestFileModel.objects.filter(object_id=obj.pk)), [fm_b])
+
+    def test_manager_bulk_cache_alias(self):
+        cache = caches['default']
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        a = CachedTestModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        b = CachedTestModel.objects.create(slug='gp-b', test_file="")
+        fm_a = TestFileModel.objects.create(content_object=a, file='test/foo.txt')
+        self.assertEqual(CachedTestModel.objects.get(pk=a.pk).test_file.related_object, fm_a)
+        self.assertIsNone(CachedTestModel.objects.get(pk=b.pk).test_file.related_object)
+
+        b.test_file_generic_rel.add(fm_a)
+        with self.assertNumQueries(2):
+            self.assertIsNone(CachedTestModel.objects.get(pk=a.pk).test_file.related_object)
+        with self.assertNumQueries(2):
+            self.assertEqual(CachedTestModel.objects.get(pk=b.pk).test_file.related_object, fm_a)
+
+    def test_manager_uses_instance(self):
+        obj = TestGenericPlusModel.objects.create(slug='gp-a', test_file="")
+        manager = obj.test_file_generic_rel
+        with self.assertNumQueries(0):
+            self.assertEqual(manager.field, TestGenericPlusModel._meta.get_field('test_file'))
+        # The INSERT and the UPDATE of the file column; the parent isn't
+        # fetched again.
+        with self.assertNumQueries(2):
+            fm_a = manager.create(file='test/foo.txt')
+        with self.assertNumQueries(0):
+            self.assertEqual(obj.test_file.name, 'test/foo.txt')
+            self.assertIs(obj.test_file.related_object, fm_a)
+        self.assertEqual(TestGenericPlusModel.objects.get(pk=obj.pk).test_file.name, 'test/foo.txt')
+
+    def test_bulk_create_with_files(self):
+        parents = [TestGenericPlusModel(slug='gp-%s' % i) for i in 'abc']
+        files = [TestFileModel(file='test/foo.txt', description='A'), 'test/bar.txt', None]
+        # Without returned primary keys, the highest key is selected before
+        # the insert of the parents, and the new keys after it
+        can_return_pks = can_return_bulk_insert_pks(connection)
+        with self.assertNumQueries(2 if can_return_pks else 4):
+            TestGenericPlusModel.objects.bulk_create_with_files(parents, 'test_file', files)
+        with self.assertNumQueries(0):
+            self.assertEqual(parents[0].test_file.related_object.description, 'A')
+            self.assertEqual(parents[1].test_file.related_object.file.name, 'test/bar.txt')
+            self.assertIsNone(parents[2].test_file.related_object)
+
+        instances = list(TestGenericPlusModel.objects.order_by('slug').prefetch_related('test_file'))
+        self.assertEqual(
+            [i.test_file.name for i in instances], ['test/foo.txt', 'test/bar.txt', ''])
+        self.assertEqual(instances[0].test_file.related_object.object_id, instances[0].pk)
+        self.assertEqual(instances[1].test_file.related_object.file.name, 'test/bar.txt')
+        self.assertIsNone(instances[2].test_file.related_object)
+
+        parents = [MultipleFileTestModel(slug='mf-%s' % i) for i in 'ab']
+        features_cls = type(connection.features)
+        with mock.patch.object(
+                features_cls, 'can_return_rows_from_bulk_insert', False, create=True):
+            with self.assertNumQueries(4):
+                MultipleFileTestModel.file_b.bulk_create_with_files(
+                    parents, ['test/foo.txt', 'test/bar.txt'])
+        self.assertEqual(
+            [p.pk for p in parents],
+            list(MultipleFileTestModel.objects.order_by('slug').values_list('pk', flat=True)))
+        rel_objs = TestFileModel.objects.filter(
+            object_id__in=[p.pk for p in parents], field_identifier='b')
+        self.assertEqual(
+            sorted(rel_objs.values_list('file', flat=True)), ['test/bar.txt', 'test/foo.txt'])
+        instances = MultipleFileTestModel.objects.filter(
+            pk__in=[p.pk for p in parents]).order_by('slug')
+        self.assertEqual([i.file_b.name for i in instances], ['test/foo.txt', 'test/bar.txt'])
+
+    def test_bulk_create_with_files_concurrent_insert(self):
+        parents = [TestGenericPlusModel(slug='gp-%s' % i) for i in 'ab']
+        queryset_cls = type(TestGenericPlusModel._base_manager.all())
+        bulk_create = queryset_cls.bulk_create
+
+        def concurrent_bulk_create(self, objs, *args, **kwargs):
+            # Another connection inserts a row after the highest key is read
+            if objs and objs[0] is parents[0]:
+                TestGenericPlusModel.objects.create(slug='gp-other')
+            return bulk_create(self, objs, *args, **kwargs)
+
+        with mock.patch.object(
+                type(connection.features), 'can_return_rows_from_bulk_insert', False,
+                create=True), \
+                mock.patch.object(queryset_cls, 'bulk_create', concurrent_bulk_create):
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                TestGenericPlusModel.test_file.bulk_create_with_files(
+                    parents, ['test/foo.txt', 'test/bar.txt'])
+        self.assertFalse(TestGenericPlusModel.objects.filter(slug__in=['gp-a', 'gp-b']).exists())
+
+    def test_can_return_bulk_insert_pks(self):
+        for rows, ids, expected in [
+                (True, False, True), (False, True, True), (False, False, False)]:
+            features = mock.Mock(
+                can_return_rows_from_bulk_insert=rows, can_return_ids_from_bulk_insert=ids)
+            self.assertEqual(
+                can_return_bulk_insert_pks(mock.Mock(features=features)), expected)
+        self.assertFalse(can_return_bulk_insert_pks(mock.Mock(features=object())))
+
+    def test_bulk_create_with_files_commits_files(self):
+        rel_obj = TestFileModel(file=ContentFile(b'Baz', name='baz.txt'))
+        parent = TestGenericPlusModel(slug='gp-a')
+        TestGenericPlusModel.test_file.bulk_create_with_files([parent], [rel_obj])
+        self.assertTrue(rel_obj.file._committed)
+        self.assertTrue(rel_obj.file.name.startswith('test/baz'))
+        self.assertTrue(default_storage.exists(rel_obj.file.name))
+        parent = TestGenericPlusModel.objects.get(pk=parent.pk)
+        self.assertEqual(parent.test_file.name, rel_obj.file.name)
+        self.assertEqual(parent.test_file.related_object.file.name, rel_obj.file.name)
+
+    def test_save_form_data_coalesced(self):
+        obj = MultipleFileTestModel.objects.create(slug='mf-a')
+        form_cls = modelform_factory(
+            MultipleFileTestModel, fields=['slug', 'file_a', 'file_b', 'file_c'])
+        form = form_cls({'slug': 'mf-b', 'file_a': '', 'file_b': '', 'file_c': ''}, instance=obj)
+        self.assertTrue(form.is_valid(), form.errors)
+        with CaptureQueriesContext(connection) as ctx:
+            form.save()
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        # The form's save of the instance, then a single save of the file
+        # columns of all three fields
+        self.assertEqual(len(updates), 2)
+        self.assertNotIn('"slug"', updates[1])
+        for field_name in ('file_a', 'file_b', 'file_c'):
+            self.assertIn('"%s"' % field_name, updates[1])
+        self.assertEqual(MultipleFileTestModel.objects.get(pk=obj.pk).slug, 'mf-b')
+
+    @unittest.skipIf(django.VERSION < (3, 2), "captureOnCommitCallbacks() needs Django 3.2+")
+    def test_sync_file_column(self):
+        obj_a = SyncedTestModel.objects.create(slug='sync-a')
+        obj_b = SyncedTestModel.objects.create(slug='sync-b')
+
+        def get_file_columns():
+            return list(SyncedTestModel.objects.order_by('slug').values_list('file_a', 'file_b'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fm_a = TestFileModel.objects.create(
+                content_object=obj_a, field_identifier='a', file='test/foo.txt')
+            self.assertEqual(get_file_columns(), [('', ''), ('', '')])
+        self.assertEqual(get_file_columns(), [('test/foo.txt', ''), ('', '')])
+
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                fm_a.file = 'test/bar.txt'
+                fm_a.save()
+                fm_b = TestFileModel.objects.create(
+                    content_object=obj_a, field_identifier='b', file='test/foo.txt')
+                TestFileModel.objects.create(
+                    content_object=obj_b, field_identifier='a', file='test/foo.txt')
+                fm_a.file = 'test/baz.txt'
+                fm_a.save()
+        # The updates of each parent are collapsed into a single UPDATE
+        parent_updates = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('UPDATE "generic_plus_syncedtestmodel"')]
+        self.assertEqual(len(parent_updates), 2)
+        self.assertEqual(get_file_columns(), [
+            ('test/baz.txt', 'test/foo.txt'), ('test/foo.txt', '')])
+
+        fm_b_pk = fm_b.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    fm_b.delete()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(get_file_columns()[0], ('test/baz.txt', 'test/foo.txt'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TestFileModel.objects.get(pk=fm_b_pk).delete()
+        self.assertEqual(get_file_columns()[0], ('test/baz.txt', ''))
+
+        # An update queued in a savepoint that rolls back is dropped, even
+        # though the transaction queued updates before the savepoint
+        obj_c = SyncedTestModel.objects.create(slug='sync-c')
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                TestFileModel.objects.create(
+                    content_object=obj_c, field_identifier='a', file='test/foo.txt')
+                try:
+                    with transaction.atomic():
+                        TestFileModel.objects.create(
+                            content_object=obj_b, field_identifier='b', file='test/bar.txt')
+                        raise ValueError
+                except ValueError:
+                    pass
+                TestFileModel.objects.filter(
+                    object_id=obj_c.pk, field_identifier='a').get().save()
+        self.assertEqual(get_file_columns()[1:], [('test/foo.txt', ''), ('test/foo.txt', '')])
+
+    @unittest.skipIf(django.VERSION < (4, 1), "The async ORM needs Django 4.1+")
+    async def test_async_manager(self):
+        obj = await TestGenericPlusModel.objects.acreate(slug='gp-a', test_file="")
+        manager = obj.test_file_generic_rel
+        fm_a = await manager.acreate(file='test/foo.txt')
+        self.assertEqual(fm_a.object_id, obj.pk)
+        fm_b = TestFileModel(file='test/bar.txt')
+        await manager.aadd(fm_b, bulk=False)
+        self.assertEqual(await manager.acount(), 2)
+        await manager.aremove(fm_a)
+        self.assertEqual([o async for o in manager.all()], [fm_b])
+        await manager.aclear()
+        self.assertFalse(await manager.aexists())
+        await manager.acreate(file='test/bar.txt')
+        file_column = TestGenericPlusModel.objects.filter(pk=obj.pk).values_list(
+            'test_file', flat=True)
+        self.assertEqual(await file_column.aget(), 'test/bar.txt')
+
+    def test_select_generic_file(self):
+        fm_a = TestFileModel.objects.create(
+            content_object=TestGenericPlusModel.objects.create(
+                slug='gp-a', test_file="test/foo.txt"),
+            file='test/foo.txt', description='A')
+        TestGenericPlusModel.objects.create(slug='gp-b', test_file="")
+
+        for supports_json in (True, False):
+            with self.subTest(supports_json=supports_json), mock.patch.dict(
+                    connection.features.__dict__, {'supports_json_field': supports_json}):
+                qset = TestGenericPlusModel.objects.order_by('slug').select_generic_file(
+                    'test_file')
+                with CaptureQueriesContext(connection) as ctx:
+                    a, b = list(qset)
+                    self.assertEqual(a.test_file.related_object, fm_a)
+                    self.assertEqual(a.test_file.related_object.object_id, a.pk)
+                    self.assertEqual(a.test_file.related_object.description, 'A')
+                    self.assertEqual(a.test_file.related_object.file.name, 'test/foo.txt')
+                    self.assertIsNone(a.test_file.related_object.related_id)
+                    self.assertIsNone(b.test_file.related_object)
+                self.assertEqual(len(ctx.captured_queries), 1)
+                # With JSON objects, the related row is looked up once
+                # rather than for each of its columns
+                self.assertEqual(
+                    ctx.captured_queries[0]['sql'].count('"field_identifier" ='),
+                    1 if supports_json and django.VERSION >= (3, 2) else 7)
+
+    def test_prefetch_related_with_queryset(self):
+        fm_a = TestFileModel.objects.create(
+            content_object=TestGenericPlusModel.objects.create(
+                slug='gp-a', test_file="test/foo.txt"),
+            file='test/foo.txt', description='A')
+        fm_a.m2m.add(TestM2M.objects.create(slug='m2m-a1'))
+        TestFileModel.objects.create(
+            content_object=TestGenericPlusModel.objects.create(
+                slug='gp-b', test_file="test/bar.txt"),
+            file='test/bar.txt', description='B')
+
+        rel_qs = TestFileModel.objects.only(
+            'pk', 'file', 'content_type', 'object_id', 'field_identifier'
+        ).prefetch_related('m2m')
+        qset = TestGenericPlusModel.objects.order_by('slug').prefetch_related(
+            Prefetch('test_file', queryset=rel_qs))
+        with self.assertNumQueries(3):
+            a, b = list(qset)
+            self.assertEqual(a.test_file.related_object, fm_a)
+            self.assertEqual([m.slug for m in a.test_file.related_object.m2m.all()], ['m2m-a1'])
+            self.assertEqual(len(b.test_file.related_object.m2m.all()), 0)
+        self.assertEqual(a.test_file.related_object.get_deferred_fields(), {'description', 'related_id'})
+
+        qset = TestGenericPlusModel.objects.order_by('slug').prefetch_related(
+            Prefetch('test_file', queryset=rel_qs, to_attr='test_file_object'))
+        with self.assertNumQueries(3):
+            a, b = list(qset)
+            self.assertEqual(a.test_file_object, fm_a)
+            self.assertEqual(b.test_file_object.file.name, 'test/bar.txt')
+
+    def test_multilevel_generic_prefetch_related_with_queryset(self):
+        a = TestGenericPlusModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        b = SecondTestGenericPlusModel.objects.create(slug='gp-b', test_file="test/bar.txt")
+        TestFileModel.objects.create(content_object=a, file='test/foo.txt')
+        TestFileModel.objects.create(content_object=b, file='test/bar.txt')
+        OtherGenericRelatedModel.objects.create(content_object=a, slug='gp-a')
+        OtherGenericRelatedModel.objects.create(content_object=b, slug='gp-b')
+
+        qset = OtherGenericRelatedModel.objects.all().prefetch_related(
+            'content_object',
+            Prefetch('content_object__test_file', queryset=TestFileModel.objects.defer('description')))
+        with self.assertNumQueries(6):
+            for instance in qset:
+                related_object = instance.content_object.test_file.related_object
+                self.assertEqual(related_object.content_object.slug, instance.slug)
+                self.assertEqual(related_object.get_deferred_fields(), {'description'})
+
+    def test_related_only(self):
+        obj = RelatedOnlyTestModel.objects.create(slug='gp-a', test_file="test/foo.txt")
+        fm_a = TestFileModel.objects.create(content_object=obj, file='test/foo.txt', description='A')
+
+        related_object = RelatedOnlyTestModel.objects.get(pk=obj.pk).test_file.related_object
+        self.assertEqual(related_object, fm_a)
+        self.assertEqual(related_object.get_deferred_fields(), {'description'})
+
+        qsets = [
+            RelatedOnlyTestModel.objects.prefetch_related('test_file'),
+            RelatedOnlyTestModel.objects.select_generic_file('test_file'),
+        ]
+        for qset in qsets:
+            related_object = qset.get(pk=obj.pk).test_file.related_object
+            self.assertEqual(related_object, fm_a)
+            self.assertEqual(related_object.file.name, 'test/foo.txt')
+            self.assertEqual(related_object.get_deferred_fields(), {'description'})
+
+        self.assertEqual(
+            RelatedOnlyTestModel.test_file.bulk_related_objects([obj]).get().get_deferred_fields(),
+            {'description'})
+
+    def test_prefetch_related_shared_related_model(self):
+        for slug in ['gp-a', 'gp-b']:
+            obj = MultipleFileTestModel.objects.create(slug=slug)
+            for field_identifier, path in [('a', 'test/foo.txt'), ('b', 'test/bar.txt')]:
+                TestFileModel.objects.create(
+                    content_object=obj, file=path, field_identifier=field_identifier)
+
+        qset = MultipleFileTestModel.objects.prefetch_related('file_a', 'file_b', 'file_c')
+        with self.assertNumQueries(2):
+            for item in qset:
+                self.assertEqual(item.file_a.related_object.file.name, 'test/foo.txt')
+                self.assertEqual(item.file_a.related_object.object_id, item.pk)
+                self.assertEqual(item.file_b.related_object.file.name, 'test/bar.txt')
+                self.assertIsNone(item.file_c.related_object)
+
+    def test_prefetch_related_interleaved_models(self):
+        instances = []
+        for i in range(2):
+            for model_cls in (TestGenericPlusModel, SecondTestGenericPlusModel):
+                obj = model_cls.objects.create(slug='gp-%d' % i, test_file="test/foo.txt")
+                TestFileModel.objects.create(content_object=obj, file='test/foo.txt')
+                instances.append(model_cls.objects.get(pk=obj.pk))
+
+        with self.assertNumQueries(1) as ctx:
+            prefetch_related_objects(instances, 'test_file')
+        self.assertEqual(ctx.captured_queries[0]['sql'].count('"content_type_id" ='), 2)
+        with self.assertNumQueries(0):
+            for instance in instances:
+                related_object = instance.test_file.related_object
+                self.assertEqual(related_object.object_id, instance.pk)
+                self.assertEqual(
+                    related_object.content_type_id,
+                    ContentType.objects.get_for_model(instance).pk)
+
+    def test_prefetch_related_chunked(self):
+        for i in range(5):
+            obj = TestGenericPlusModel.objects.create(slug='gp-%d' % i, test_file="test/foo.txt")
+            TestFileModel.objects.create(content_object=obj, file='test/foo.txt', description=str(i))
+
+        field = TestGenericPlusModel.test_file
+        field.prefetch_chunk_size = 2
+        try:
+            instances = list(TestGenericPlusModel.objects.all())
+            with self.assertNumQueries(3):
+                prefetch_related_objects(instances, 'test_file')
+
+            # Through GenericPlusQuerySet, a subquery on the parent queryset
+            # is used instead.
+            with self.assertNumQueries(2) as ctx:
+                instances = list(TestGenericPlusModel.objects.filter(
+                    slug__startswith='gp-').prefetch_related('test_file'))
+            self.assertIn('"object_id" IN (SELECT', ctx.captured_queries[1]['sql'])
+        finally:
+            field.prefetch_chunk_size = None
+
+        with self.assertNumQueries(0):
+            for instance in instances:
+                related_object = instance.test_file.related_object
+                self.assertEqual(related_object.object_id, instance.pk)
+                self.assertEqual(related_object.description, instance.slug[3:])
+
+    def test_prefetch_related_parallel(self):
+        for i in range(3):
+            obj = TestGenericPlusModel.objects.create(slug='gp-%d' % i, test_file="test/foo.txt")
+            TestFileModel.objects.create(content_object=obj, file='test/foo.txt', description=str(i))
+
+        field = TestGenericPlusModel.test_file
+        field.prefetch_chunk_size = 1
+        try:
+            # Inside the test transaction the chunks are queried one after
+            # another, on this thread's connection.
+            with self.assertNumQueries(4):
+                instances = list(TestGenericPlusModel.objects.prefetch_related(
+                    'test_file').parallel_prefetch(max_workers=2)[:3])
+        finally:
+            field.prefetch_chunk_size = None
+
+        with self.assertNumQueries(0):
+            for instance in instances:
+                related_object = instance.test_file.related_object
+                self.assertEqual(related_object.object_id, instance.pk)
+                self.assertEqual(related_object.description, instance.slug[3:])
+
+
+class TestParallelPrefetch(test.TransactionTestCase):
+    """
+    Outside of a transaction, whose changes other connections couldn't see,
+    parallel prefetches run their queries on worker threads (SQLite's
+    in-memory test database is shared between their connections).
+    """
+
+    def test_prefetch_related_parallel(self):
+        for i in range(3):
+            obj = TestGenericPlusModel.objects.create(slug='gp-%d' % i, test_file="test/foo.txt")
+            TestFileModel.objects.create(content_object=obj, file='test/foo.txt', description=str(i))
+
+        thread_ids = []
+        evaluate_queryset_in_thread = prefetch._evaluate_queryset_in_thread
+
+        def evaluate_queryset(queryset):
+            thread_ids.append(threading.get_ident())
+            return evaluate_queryset_in_thread(queryset)
+
+        with mock.patch.object(TestField, 'get_prefetch_chunk_size', return_value=1), \
+                mock.patch.object(prefetch, '_evaluate_queryset_in_thread', evaluate_queryset), \
+                mock.patch.object(prefetch.connections, 'close_all') as close_all:
+            # Only the query of the instances runs on this thread; the slice
+            # keeps the object ids from being matched with a subquery
+            with self.assertNumQueries(1):
+                instances = list(TestGenericPlusModel.objects.order_by('slug').prefetch_related(
+                    'test_file').parallel_prefetch(max_workers=2)[:3])
+
+        self.assertEqual(len(thread_ids), 3)
+        self.assertNotIn(threading.get_ident(), thread_ids)
+        self.assertEqual(close_all.call_count, 3)
+        with self.assertNumQueries(0):
+            for instance in instances:
+                related_object = instance.test_file.related_object
+                self.assertEqual(related_object.object_id, instance.pk)
+                self.assertEqual(related_object.description, instance.slug[3:])
+
+
+@test.override_settings(GENERIC_PLUS_READ_REPLICAS=['replica'])
+class TestReplicaRouter(test.SimpleTestCase):
+
+    def setUp(self):
+        self.router = GenericFileReplicaRouter()
+        clear_pinned()
+        self.addCleanup(clear_pinned)
+
+    def test_reads_use_replica(self):
+        instance = TestGenericPlusModel(pk=1)
+        instance._state.db = 'default'
+        self.assertEqual(self.router.db_for_read(
+            TestFileModel, instance=instance, **{READ_HINT: True}), 'replica')
+        self.assertIsNone(self.router.db_for_read(TestFileModel, instance=instance))
+
+    def test_cache_keys_use_primary(self):
+        field = CachedTestModel._meta.get_field('test_file')
+        self.assertEqual(
+            get_cache_key(field, 1, 1, '', 'replica'), get_cache_key(field, 1, 1, '', 'default'))
+
+    def test_reads_stick_to_primary_after_write(self):
+        rel_obj = TestFileModel(pk=1)
+        rel_obj._state.db = 'replica'
+        self.assertEqual(self.router.db_for_write(TestFileModel, instance=rel_obj), 'default')
+        self.assertEqual(self.router.db_for_read(
+            TestFileModel, instance=TestGenericPlusModel(pk=1), **{READ_HINT: True}), 'default')
+
+        clear_pinned()
+        self.assertEqual(self.router.db_for_read(
+            TestFileModel, instance=TestGenericPlusModel(pk=1), **{READ_HINT: True}), 'replica')
@@ -4,7 +4,7 @@ import re
 from django.conf import settings
 
 
-__all__ = ('get_media_path', 'get_relative_media_url')
+__all__ = ('get_media_path', 'get_relative_media_url', 'chunked')
 
 
 re_url_slashes = re.compile(r'(?:\A|(?<=/))/')
@@ -30,3 +30,12 @@ def get_relative_media_url(path, clean_slashes=True):
     if clean_slashes:
         url = re_url_slashes.sub('', url)
     return url
+
+
+def chunked(items, size):
+    """Split a list into lists of at most ``size`` items (all, if size is None)."""
+    if not size:
+        yield items
+        return
+    for i in range(0, len(items), size):
+        yield items[i:i + size]